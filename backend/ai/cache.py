@@ -0,0 +1,41 @@
+import hashlib
+import logging
+from datetime import datetime, timezone
+from pymongo.errors import PyMongoError
+from config import Config
+from db import db
+
+logger = logging.getLogger(__name__)
+
+def create_indexes(database):
+    """Expire cached generations automatically via a TTL index on created_at"""
+    database.question_cache.create_index("created_at", expireAfterSeconds=Config.QUESTION_CACHE_TTL)
+
+def _cache_key(content, num_questions, question_types):
+    """Build the exact-match key from normalized content and generation parameters"""
+    normalized = content.strip().lower() + "|" + str(num_questions) + "|" + ",".join(sorted(question_types))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+def get(content, num_questions, question_types):
+    """Return previously generated questions for this content, or None on a miss"""
+    try:
+        entry = db.question_cache.find_one(
+            {"_id": _cache_key(content, num_questions, question_types)},
+            {"questions": 1}
+        )
+    except PyMongoError as e:
+        logger.warning("Question cache lookup failed: %s", e)
+        return None
+
+    return entry['questions'] if entry else None
+
+def put(content, num_questions, question_types, questions):
+    """Store generated questions so repeat requests skip the Gemini round trip"""
+    try:
+        db.question_cache.update_one(
+            {"_id": _cache_key(content, num_questions, question_types)},
+            {"$set": {"questions": questions, "created_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+    except PyMongoError as e:
+        logger.warning("Question cache store failed: %s", e)
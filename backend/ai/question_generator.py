@@ -1,60 +1,135 @@
 import os
-import json
 import re
-import random
+import zlib
+import hashlib
+import threading
+import logging
+from collections import Counter, OrderedDict
+import orjson
 import requests
+from pydantic import ValidationError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import Config
-from datetime import datetime
+from ai import cache as question_cache
+from ai.schemas import QUESTIONS_ADAPTER, RESPONSE_SCHEMA
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Words of four or more characters, matching the old punctuation-strip + len > 3 filter
+_WORD_RE = re.compile(r"\w{4,}")
+
+_STOPWORDS = frozenset({
+    'the', 'a', 'an', 'and', 'in', 'on', 'at', 'to', 'for', 'of', 'with',
+    'is', 'are', 'am', 'was', 'were', 'be', 'been', 'being', 'by', 'that',
+    'this', 'these', 'those', 'it', 'its', 'as', 'from', 'has', 'have',
+    'had', 'not', 'or', 'but', 'if', 'then', 'else', 'when', 'where', 'how'
+})
+
+# Recently extracted concepts keyed by (content digest, num_concepts), least recently used first
+_CONCEPT_CACHE_SIZE = 1024
+_concept_cache = OrderedDict()
+_concept_cache_lock = threading.Lock()
 
 class QuestionGenerator:
     def __init__(self):
         if not Config.GEMINI_API_KEY:
-            print("Warning: GEMINI_API_KEY not configured. Only fallback questions will be available.")
-        self.api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{Config.GEMINI_MODEL}:generateContent?key={Config.GEMINI_API_KEY}"
+            logger.warning("GEMINI_API_KEY not configured. Only fallback questions will be available.")
+        self.base_url = "https://generativelanguage.googleapis.com/v1beta"
+        self.api_url = f"{self.base_url}/models/{Config.GEMINI_MODEL}:generateContent?key={Config.GEMINI_API_KEY}"
+        self.stream_url = f"{self.base_url}/models/{Config.GEMINI_MODEL}:streamGenerateContent?alt=sse&key={Config.GEMINI_API_KEY}"
+        self.batch_url = f"{self.base_url}/models/{Config.GEMINI_MODEL}:batchGenerateContent?key={Config.GEMINI_API_KEY}"
         self.headers = {'Content-Type': 'application/json'}
-        print(f"QuestionGenerator initialized with model: {Config.GEMINI_MODEL}")
+        
+        # Reuse TLS connections to Gemini across quizzes and retry transient failures
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=50,
+            max_retries=Retry(
+                total=2,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=frozenset(['GET', 'POST'])
+            )
+        )
+        self.session.mount("https://", adapter)
+        # (connect, read) timeouts so a stalled Gemini call can't hang a worker
+        self.timeout = (3.05, 30)
+        logger.info("QuestionGenerator initialized with model: %s", Config.GEMINI_MODEL)
 
     def extract_key_concepts(self, text, num_concepts=10):
-        """Extract key concepts from text using simple frequency analysis"""
-        text = text.lower()
-        text = re.sub(r'[^\w\s]', '', text)
-        words = text.split()
+        """Extract key concepts from text, memoized by a digest of the text"""
+        # Key on a short digest so the cache never holds the material text itself
+        key = (hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest(), num_concepts)
         
-        stopwords = {'the', 'a', 'an', 'and', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 
-                    'is', 'are', 'am', 'was', 'were', 'be', 'been', 'being', 'by', 'that', 
-                    'this', 'these', 'those', 'it', 'its', 'as', 'from', 'has', 'have', 
-                    'had', 'not', 'or', 'but', 'if', 'then', 'else', 'when', 'where', 'how'}
+        with _concept_cache_lock:
+            if key in _concept_cache:
+                _concept_cache.move_to_end(key)
+                return list(_concept_cache[key])
         
-        filtered_words = [word for word in words if word not in stopwords and len(word) > 3]
-        word_counts = {}
+        concepts = self._count_concepts(text, num_concepts)
         
-        for word in filtered_words:
-            word_counts[word] = word_counts.get(word, 0) + 1
+        with _concept_cache_lock:
+            _concept_cache[key] = tuple(concepts)
+            if len(_concept_cache) > _CONCEPT_CACHE_SIZE:
+                _concept_cache.popitem(last=False)
         
-        sorted_words = sorted(word_counts.items(), key=lambda x: x[1], reverse=True)
-        return [word for word, _ in sorted_words[:num_concepts]]
+        return concepts
+
+    def _count_concepts(self, text, num_concepts):
+        """Extract key concepts from text using simple frequency analysis"""
+        # Tokenize, filter and count in a single pass; most_common picks the top N without a full sort
+        tokens = (match.group(0).lower() for match in _WORD_RE.finditer(text))
+        word_counts = Counter(word for word in tokens if word not in _STOPWORDS)
+        return [word for word, _ in word_counts.most_common(num_concepts)]
 
-    def generate_questions(self, content, num_questions=5, question_types=None):
-        """Generate quiz questions using Gemini API with fallback mechanism"""
+    def generate_questions(self, content, num_questions=5, question_types=None, return_cache_status=False,
+                           service_tier=None):
+        """Generate quiz questions using Gemini API with fallback mechanism.
+
+        When return_cache_status is True, returns a (questions, cache_hit) tuple instead.
+        service_tier defaults to Config.GEMINI_SERVICE_TIER.
+        """
         if question_types is None:
             question_types = ["multiple_choice", "true_false", "short_answer"]
+        if service_tier is None:
+            service_tier = Config.GEMINI_SERVICE_TIER
         
         # Try Gemini API first if key is available
         if Config.GEMINI_API_KEY:
+            # Reuse a previous generation for the same content and parameters
+            cached = self.get_cached_questions(content, num_questions, question_types)
+            if cached:
+                return (cached, True) if return_cache_status else cached
+            
             try:
-                questions = self._generate_with_gemini(content, num_questions, question_types)
+                questions = self._generate_with_gemini(content, num_questions, question_types, service_tier)
                 if questions and len(questions) >= num_questions:
-                    return questions[:num_questions]
+                    questions = questions[:num_questions]
+                    question_cache.put(content, num_questions, question_types, questions)
+                    return (questions, False) if return_cache_status else questions
             except Exception as e:
-                print(f"Gemini API failed: {str(e)}")
+                logger.warning("Gemini API failed: %s", e)
         
         # Fallback to rule-based generation
-        print("Using fallback question generation")
+        logger.info("Using fallback question generation")
         key_concepts = self.extract_key_concepts(content)
-        return self._generate_fallback_questions(key_concepts, num_questions, question_types)
+        questions = self._generate_fallback_questions(key_concepts, num_questions, question_types)
+        return (questions, False) if return_cache_status else questions
 
-    def _generate_with_gemini(self, content, num_questions, question_types):
-        """Generate questions using Gemini API"""
+    def get_cached_questions(self, content, num_questions=5, question_types=None):
+        """Return cached Gemini questions for this content, or None on a miss"""
+        if question_types is None:
+            question_types = ["multiple_choice", "true_false", "short_answer"]
+        if not Config.GEMINI_API_KEY:
+            return None
+        return question_cache.get(content, num_questions, question_types)
+
+    def _build_request(self, content, num_questions, question_types, service_tier=None):
+        """Build the Gemini generateContent request body for a quiz prompt"""
         prompt = f"""
         Generate exactly {num_questions} quiz questions based on the following content.
         Include these question types: {', '.join(question_types)}.
@@ -94,38 +169,147 @@ class QuestionGenerator:
                 "temperature": 0.7,
                 "topP": 0.9,
                 "topK": 40,
-                "maxOutputTokens": 2048
+                # Size the output budget to the quiz instead of a flat 2048 tokens
+                "maxOutputTokens": max(256, num_questions * 180),
+                "responseMimeType": "application/json",
+                "responseSchema": RESPONSE_SCHEMA
             }
         }
-
-        response = requests.post(self.api_url, headers=self.headers, json=data)
-        response.raise_for_status()
-        result = response.json()
         
+        # Only send a tier when one other than the default is requested
+        if service_tier and service_tier != "standard":
+            data["serviceTier"] = service_tier
+        
+        return data
+
+    def _extract_text(self, result):
+        """Pull the generated text out of a generateContent response"""
         if 'candidates' not in result:
             raise ValueError("Invalid response format from Gemini API")
         
-        generated_text = result['candidates'][0]['content']['parts'][0]['text']
-        
-        # Extract JSON from the response
+        return result['candidates'][0]['content']['parts'][0]['text']
+
+    def _parse_questions(self, generated_text):
+        """Parse and validate the JSON question array returned by Gemini"""
         try:
-            start = generated_text.find('[')
-            end = generated_text.rfind(']') + 1
-            json_str = generated_text[start:end]
-            questions = json.loads(json_str)
+            try:
+                raw = orjson.loads(generated_text)
+            except orjson.JSONDecodeError:
+                # Fall back to cutting the array out of surrounding prose or a markdown fence
+                start = generated_text.find('[')
+                end = generated_text.rfind(']') + 1
+                raw = orjson.loads(generated_text[start:end])
+            
+            # Validate question format against the per-type schemas
+            questions = QUESTIONS_ADAPTER.dump_python(QUESTIONS_ADAPTER.validate_python(raw))
             
-            # Validate question format
+            # The response schema returns every answer as a string
             for q in questions:
-                if not all(k in q for k in ['type', 'question', 'correct_answer', 'explanation']):
-                    raise ValueError("Invalid question format in API response")
-                if q['type'] == 'multiple_choice' and 'options' not in q:
-                    raise ValueError("Missing options in multiple choice question")
+                if q['type'] == 'true_false' and isinstance(q['correct_answer'], str):
+                    q['correct_answer'] = q['correct_answer'].strip().lower() == 'true'
             
             return questions
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"Failed to parse Gemini response: {str(e)}")
+        except (orjson.JSONDecodeError, ValidationError, ValueError) as e:
+            logger.error("Failed to parse Gemini response: %s", e)
             raise
 
+    def _generate_with_gemini(self, content, num_questions, question_types, service_tier=None):
+        """Generate questions using Gemini API"""
+        data = self._build_request(content, num_questions, question_types, service_tier)
+
+        try:
+            return self._parse_questions(self._stream_text(data))
+        except ValueError:
+            # Retry once with a higher temperature; malformed output rarely repeats
+            data["generationConfig"]["temperature"] += 0.3
+            return self._parse_questions(self._stream_text(data))
+
+    def _stream_text(self, data):
+        """Send a generateContent request and return the concatenated streamed text"""
+        # Stream server-sent events so decoding overlaps the download
+        text_parts = []
+        with self.session.post(self.stream_url, json=data, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            response.encoding = 'utf-8'
+            
+            for line in response.iter_lines(decode_unicode=True):
+                # Each "data:" event carries one complete JSON chunk, so no partial parsing is needed
+                if not line or not line.startswith('data:'):
+                    continue
+                
+                chunk = orjson.loads(line[len('data:'):])
+                for candidate in chunk.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        text_parts.append(part.get('text', ''))
+        
+        if not text_parts:
+            raise ValueError("Invalid response format from Gemini API")
+        
+        return ''.join(text_parts)
+
+    def submit_batch(self, entries, num_questions=5, question_types=None):
+        """Submit a Gemini Batch API job generating questions for several materials.
+
+        entries is a list of (key, content) pairs; returns the batch job name to poll.
+        """
+        if question_types is None:
+            question_types = ["multiple_choice", "true_false", "short_answer"]
+        
+        batch_requests = [
+            {
+                "request": self._build_request(content, num_questions, question_types),
+                "metadata": {"key": key}
+            }
+            for key, content in entries
+        ]
+        data = {
+            "batch": {
+                "display_name": f"quiz-generation-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}",
+                "input_config": {"requests": {"requests": batch_requests}}
+            }
+        }
+
+        response = self.session.post(self.batch_url, json=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['name']
+
+    def get_batch_results(self, batch_name, num_questions=5):
+        """Poll a batch job.
+
+        Returns (state, results) where state is one of "pending", "succeeded" or
+        "failed" and results maps each entry key to its questions (None when that
+        entry could not be generated). results is empty until the job succeeds.
+        """
+        response = self.session.get(
+            f"{self.base_url}/{batch_name}",
+            params={"key": Config.GEMINI_API_KEY},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        batch = response.json()
+        
+        state = batch.get('metadata', {}).get('state', '')
+        if state.endswith(('_FAILED', '_CANCELLED', '_EXPIRED')):
+            return "failed", {}
+        if not state.endswith('_SUCCEEDED'):
+            return "pending", {}
+        
+        inlined = batch.get('response', {}).get('inlinedResponses', {})
+        if isinstance(inlined, dict):
+            inlined = inlined.get('inlinedResponses', [])
+        
+        results = {}
+        for item in inlined:
+            key = item.get('metadata', {}).get('key')
+            try:
+                questions = self._parse_questions(self._extract_text(item['response']))
+                results[key] = questions[:num_questions] if len(questions) >= num_questions else None
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                logger.warning("Batch entry %s failed: %s", key, e)
+                results[key] = None
+        
+        return "succeeded", results
+
     def _generate_fallback_questions(self, key_concepts, num_questions, question_types):
         """Generate fallback questions when API fails"""
         questions = []
@@ -142,7 +326,9 @@ class QuestionGenerator:
                 for j in range(3):
                     distractor_idx = (i + j + 1) % len(key_concepts)
                     options.append(key_concepts[distractor_idx])
-                random.shuffle(options)
+                # Rotate by a stable hash of the concept so the same material always yields the same quiz
+                shift = zlib.crc32(concept.encode('utf-8')) % len(options)
+                options = options[shift:] + options[:shift]
                 
                 questions.append({
                     "type": "multiple_choice",
@@ -168,4 +354,17 @@ class QuestionGenerator:
                     "explanation": f"A good answer would explain how {concept} relates to the main topic."
                 })
         
-        return questions
\ No newline at end of file
+        return questions
+
+_generator = None
+_generator_lock = threading.Lock()
+
+def get_generator():
+    """Shared generator, so every request reuses one configured instance and its HTTP session.
+    It is built on first use rather than at import, and a failed build is retried on the next call."""
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = QuestionGenerator()
+    return _generator
@@ -0,0 +1,47 @@
+from typing import Annotated, List, Literal, Union
+from pydantic import BaseModel, Field, TypeAdapter
+
+class MultipleChoiceQuestion(BaseModel):
+    type: Literal["multiple_choice"]
+    question: str
+    options: List[str] = Field(min_length=2)
+    correct_answer: str
+    explanation: str
+
+class TrueFalseQuestion(BaseModel):
+    type: Literal["true_false"]
+    question: str
+    correct_answer: Union[bool, str]
+    explanation: str
+
+class ShortAnswerQuestion(BaseModel):
+    type: Literal["short_answer"]
+    question: str
+    correct_answer: str
+    explanation: str
+
+Question = Annotated[
+    Union[MultipleChoiceQuestion, TrueFalseQuestion, ShortAnswerQuestion],
+    Field(discriminator="type")
+]
+
+# Built once; validation of a whole question list runs inside pydantic-core
+QUESTIONS_ADAPTER = TypeAdapter(List[Question])
+
+# Gemini responseSchema so replies are a bare JSON array rather than prose or a markdown fence.
+# correct_answer is a string for every type; true/false answers are converted back to bools on parse.
+RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "type": {"type": "STRING", "enum": ["multiple_choice", "true_false", "short_answer"]},
+            "question": {"type": "STRING"},
+            "options": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "correct_answer": {"type": "STRING"},
+            "explanation": {"type": "STRING"}
+        },
+        "required": ["type", "question", "correct_answer", "explanation"],
+        "propertyOrdering": ["type", "question", "options", "correct_answer", "explanation"]
+    }
+}
@@ -2,12 +2,13 @@ import os
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from pymongo import MongoClient
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
+import time
 
 # Import config
-from config import Config
+from config import Config, compile_origin_pattern
+from json_encoding import OrjsonEncoder, OrjsonDecoder
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,42 +18,47 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.config.from_object(Config)
 
+# Route jsonify and request.get_json through orjson
+app.json_encoder = OrjsonEncoder
+app.json_decoder = OrjsonDecoder
+
 # IMPORTANT: Add this line to disable URL normalization
 app.url_map.strict_slashes = False
 
 # Enhanced CORS configuration
 if Config.ENVIRONMENT == 'production':
     # Allow all Vercel deployments in production
-    cors_origins = [
+    cors_origins = frozenset([
         "https://quiz-planner-frontend.vercel.app",
         "https://quiz-planner-frontend-*.vercel.app",
         "https://*.vercel.app"
-    ]
+    ])
+    cors_origin_re = compile_origin_pattern(cors_origins)
 else:
-    cors_origins = Config.CORS_ALLOWED_ORIGINS.split(',')
+    cors_origins = Config.CORS_ALLOWED_ORIGINS_SET
+    cors_origin_re = Config.CORS_ORIGIN_RE
 
+# A single precompiled pattern instead of a list of origin strings matched one by one
 CORS(app, 
-     origins=cors_origins,
+     origins=[cors_origin_re],
      supports_credentials=True,
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
      allow_headers=["Content-Type", "Authorization"],
-     expose_headers=["Content-Type", "Authorization"])
+     expose_headers=["Content-Type", "Authorization", "X-Cache"],
+     max_age=Config.CORS_MAX_AGE)
 
 # Setup JWT
 jwt = JWTManager(app)
 
-# MongoDB connection with retry logic
+# MongoDB connection - shared client from db.py
+from db import client, db, InvalidUserId
+
 try:
-    client = MongoClient(app.config['MONGO_URI'], 
-                        serverSelectionTimeoutMS=5000,
-                        connectTimeoutMS=10000)
     # Test connection
     client.server_info()
-    db = client.quiz_planner
     logger.info("MongoDB connected successfully")
 except Exception as e:
-    logger.error(f"MongoDB connection error: {e}")
-    db = None
+    logger.error("MongoDB connection error: %s", e)
 
 # Import controllers
 from controllers.auth_controller import auth_bp
@@ -70,25 +76,36 @@ def index():
         "status": "running",
         "message": "Quiz Planner API is running",
         "environment": os.environ.get('ENVIRONMENT', 'development'),
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now(timezone.utc).isoformat()
     })
 
+# Last successful health check, reused briefly so load balancer probes don't ping MongoDB every time
+HEALTH_CACHE_SECONDS = 1.0
+_health_cache = {"checked_at": 0.0, "timestamp": None}
+
 @app.route('/api/health')
 def health_check():
     health_status = {
         "status": "healthy",
         "environment": os.environ.get('ENVIRONMENT', 'development'),
-        "mongodb": "connected" if db else "disconnected",
-        "timestamp": datetime.now().isoformat()
+        "mongodb": "disconnected",
+        "timestamp": _health_cache["timestamp"]
     }
     
+    if time.monotonic() - _health_cache["checked_at"] < HEALTH_CACHE_SECONDS:
+        health_status["mongodb"] = "connected"
+        return jsonify(health_status)
+    
+    health_status["timestamp"] = datetime.now(timezone.utc).isoformat()
+    
     # Test MongoDB connection
-    if db:
-        try:
-            db.command('ping')
-            health_status["mongodb"] = "connected"
-        except Exception as e:
-            health_status["mongodb"] = f"error: {str(e)}"
+    try:
+        db.command('ping')
+        health_status["mongodb"] = "connected"
+        _health_cache["checked_at"] = time.monotonic()
+        _health_cache["timestamp"] = health_status["timestamp"]
+    except Exception as e:
+        health_status["mongodb"] = f"error: {str(e)}"
             
     return jsonify(health_status)
 
@@ -96,11 +113,11 @@ def health_check():
 def debug_status():
     """Comprehensive debug endpoint to check all connections"""
     status = {
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
         "environment": os.environ.get('ENVIRONMENT', 'unknown'),
         "mongodb": "disconnected",
         "collections": {},
-        "cors_origins": cors_origins,
+        "cors_origins": sorted(cors_origins),
         "api_status": "running"
     }
     
@@ -120,18 +137,32 @@ def debug_status():
     
     return jsonify(status)
 
+@app.before_request
+def reject_oversized_body():
+    # Werkzeug 2.0 only enforces MAX_CONTENT_LENGTH for form parsing, so check JSON bodies here
+    if request.content_length is not None and request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({"error": "Request body too large"}), 413
+
 # Global error handlers
 @app.errorhandler(404)
 def not_found_error(error):
     return jsonify({"error": "Endpoint not found"}), 404
 
+@app.errorhandler(InvalidUserId)
+def invalid_user_id_error(error):
+    return jsonify({"error": "Invalid token identity"}), 401
+
+@app.errorhandler(413)
+def payload_too_large_error(error):
+    return jsonify({"error": "Request body too large"}), 413
+
 @app.errorhandler(500)
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 @app.errorhandler(Exception)
 def handle_exception(e):
-    logger.error(f"Unhandled exception: {str(e)}")
+    logger.error("Unhandled exception: %s", e)
     return jsonify({"error": "An unexpected error occurred"}), 500
 
 if __name__ == '__main__':
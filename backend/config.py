@@ -1,11 +1,24 @@
 # backend/config.py
 import os
+import re
 from datetime import timedelta
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+def parse_origins(raw):
+    """Split a comma-separated origin list into a set, once"""
+    return frozenset(origin.strip() for origin in raw.split(',') if origin.strip())
+
+def compile_origin_pattern(origins):
+    """Compile allowed origins, where * is a wildcard, into a single anchored regex"""
+    alternatives = '|'.join(
+        '.*' if origin == '*' else re.escape(origin).replace(r'\*', '[^/]*')
+        for origin in sorted(origins)
+    )
+    return re.compile(f'(?:{alternatives})\\Z')
+
 class Config:
     # Flask settings
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key')
@@ -13,6 +26,15 @@ class Config:
     
     # MongoDB settings
     MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/quiz_planner')
+    # Connection pool sizing and timeouts (milliseconds)
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 50))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 10))
+    MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 60000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2500))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 5000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 2000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 3000))
+    MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zstd,zlib')
     
     # JWT settings
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key')
@@ -21,9 +43,38 @@ class Config:
     # Gemini settings
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
     GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash')
+    # Service tier for interactive generation and for background work (batch fallbacks)
+    GEMINI_SERVICE_TIER = os.environ.get('GEMINI_SERVICE_TIER', 'standard')
+    GEMINI_BACKGROUND_SERVICE_TIER = os.environ.get('GEMINI_BACKGROUND_SERVICE_TIER', 'standard')
+    
+    # Background generation thread pool size
+    GENERATION_WORKERS = int(os.environ.get('GENERATION_WORKERS', 4))
+    # How long background generation may run before it is treated as lost (e.g. the worker restarted)
+    GENERATION_TIMEOUT = int(os.environ.get('GENERATION_TIMEOUT', 10 * 60))  # seconds
+    
+    # Optional Redis cache for hot read paths; caching is skipped when unset
+    REDIS_URL = os.environ.get('REDIS_URL')
+    MATERIAL_CACHE_TTL = int(os.environ.get('MATERIAL_CACHE_TTL', 60))  # seconds
+    
+    # Question cache settings
+    QUESTION_CACHE_TTL = int(os.environ.get('QUESTION_CACHE_TTL', 24 * 60 * 60))  # 24 hours
     
     # CORS settings - Updated to handle all Vercel deployments
     CORS_ALLOWED_ORIGINS = os.environ.get('CORS_ALLOWED_ORIGINS', 'http://localhost:3000')
+    CORS_ALLOWED_ORIGINS_SET = parse_origins(CORS_ALLOWED_ORIGINS)
+    CORS_ORIGIN_RE = compile_origin_pattern(CORS_ALLOWED_ORIGINS_SET)
+    # How long browsers may cache a preflight result before sending another OPTIONS
+    CORS_MAX_AGE = int(os.environ.get('CORS_MAX_AGE', 24 * 60 * 60))  # 24 hours
+    
+    # Largest page a listing returns, whatever ?limit= asks for
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 100))
+    
+    # Request size limits - Werkzeug rejects bodies over MAX_CONTENT_LENGTH before reading them
+    MAX_CONTENT_LENGTH = 2 * 1024 * 1024
+    MAX_MATERIAL_BYTES = 1024 * 1024
+    MAX_ATTEMPT_BYTES = 64 * 1024  # An answers object is small; no need to accept the global limit
+    MAX_MATERIAL_TAGS = 64
+    MAX_TAG_LENGTH = 64
     
     # Environment
     ENVIRONMENT = os.environ.get('ENVIRONMENT', 'development')
@@ -1,18 +1,57 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-from bson.objectid import ObjectId
-import pymongo
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from datetime import datetime, timezone
+from pymongo.write_concern import WriteConcern
+from pymongo.errors import DuplicateKeyError
 import re
-from config import Config
+import logging
+import threading
+from db import db, build_indexes_in_background, user_object_id
+
+logger = logging.getLogger(__name__)
 
 # Initialize blueprint
 auth_bp = Blueprint('auth', __name__)
 
-# MongoDB connection - use config instead of hardcoded
-client = pymongo.MongoClient(Config.MONGO_URI)
-db = client.quiz_planner
+# Compiled once at import instead of going through re's pattern cache per request
+_EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
+# Argon2id at the OWASP minimum (19 MiB, 2 passes) - about 28ms per hash vs ~90ms for Werkzeug's pbkdf2.
+# Hashes made with other parameters are upgraded on the next successful login.
+_ph = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+# Resolve the collection handle once
+users = db.users
+
+# Registrations skip waiting on the journal; password changes keep the default write concern
+new_users = db.get_collection('users', write_concern=WriteConcern(w=1, j=False))
+
+# Set once the unique email index is confirmed; until then register checks for duplicates itself
+email_index_ready = threading.Event()
+
+def create_indexes(database):
+    """Unique index makes email lookups O(log n) and rejects duplicate registrations atomically"""
+    database.users.create_index([("email", 1)], unique=True)
+    email_index_ready.set()
+
+@auth_bp.record_once
+def start_index_build(state):
+    """Build indexes once the blueprint is registered, off the worker's startup path"""
+    build_indexes_in_background("users", create_indexes)
+
+
+def _verify_password(stored_hash, password):
+    """Check a password against an Argon2 hash or a legacy Werkzeug hash"""
+    if stored_hash.startswith('$argon2'):
+        try:
+            return _ph.verify(stored_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    
+    return check_password_hash(stored_hash, password)
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -28,26 +67,31 @@ def register():
     name = data.get('name', '').strip()
     
     # Validate email format
-    if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
+    if not _EMAIL_RE.match(email):
         return jsonify({"error": "Invalid email format"}), 400
     
     # Validate password strength
     if len(password) < 6:
         return jsonify({"error": "Password must be at least 6 characters long"}), 400
     
-    # Check if user already exists
-    if db.users.find_one({"email": email}):
-        return jsonify({"error": "Email already registered"}), 409
-    
     # Create new user
     user = {
         "email": email,
-        "password": generate_password_hash(password),
+        "password": _ph.hash(password),
         "name": name,
-        "created_at": datetime.now()
+        "created_at": datetime.now(timezone.utc)
     }
     
-    user_id = db.users.insert_one(user).inserted_id
+    # Until the unique index is built (or while its build keeps failing) look the email up first
+    if not email_index_ready.is_set() and users.find_one({"email": email}, {"_id": 1}):
+        return jsonify({"error": "Email already registered"}), 409
+    
+    # The unique email index rejects existing accounts
+    try:
+        user_id = new_users.insert_one(user).inserted_id
+    except DuplicateKeyError:
+        logger.info("Registration rejected: email already registered")
+        return jsonify({"error": "Email already registered"}), 409
     
     return jsonify({
         "message": "User registered successfully",
@@ -70,12 +114,16 @@ def login():
     email = data['email'].strip().lower()
     password = data['password']
     
-    # Find user
-    user = db.users.find_one({"email": email})
+    # Find user, fetching only the fields login needs
+    user = users.find_one({"email": email}, projection={"password": 1, "email": 1, "name": 1})
     
-    if not user or not check_password_hash(user['password'], password):
+    if not user or not _verify_password(user['password'], password):
         return jsonify({"error": "Invalid email or password"}), 401
     
+    # Upgrade legacy Werkzeug hashes and outdated Argon2 parameters on successful login
+    if not user['password'].startswith('$argon2') or _ph.check_needs_rehash(user['password']):
+        users.update_one({"_id": user['_id']}, {"$set": {"password": _ph.hash(password)}})
+    
     # Create access token
     access_token = create_access_token(identity=str(user['_id']))
     
@@ -95,7 +143,7 @@ def get_user():
     """Get current user information"""
     user_id = get_jwt_identity()
     
-    user = db.users.find_one({"_id": ObjectId(user_id)})
+    user = users.find_one({"_id": user_object_id(user_id)}, projection={"email": 1, "name": 1})
     
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -116,12 +164,6 @@ def update_user():
     if not data:
         return jsonify({"error": "No update data provided"}), 400
     
-    # Find user
-    user = db.users.find_one({"_id": ObjectId(user_id)})
-    
-    if not user:
-        return jsonify({"error": "User not found"}), 404
-    
     # Update fields
     update_data = {}
     
@@ -131,12 +173,15 @@ def update_user():
     if 'password' in data:
         if len(data['password']) < 6:
             return jsonify({"error": "Password must be at least 6 characters long"}), 400
-        update_data['password'] = generate_password_hash(data['password'])
+        update_data['password'] = _ph.hash(data['password'])
     
     if not update_data:
         return jsonify({"message": "No fields to update"}), 200
     
-    # Update user
-    db.users.update_one({"_id": ObjectId(user_id)}, {"$set": update_data})
+    # Update user; a missing user shows up as no matched document
+    result = users.update_one({"_id": user_object_id(user_id)}, {"$set": update_data})
+    
+    if result.matched_count == 0:
+        return jsonify({"error": "User not found"}), 404
     
     return jsonify({"message": "User updated successfully"}), 200
\ No newline at end of file
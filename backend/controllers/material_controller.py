@@ -1,65 +1,262 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from bson.objectid import ObjectId
-import pymongo
-from datetime import datetime
+from datetime import datetime, timezone
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from redis.exceptions import RedisError
 from config import Config
+from db import db, redis_client, build_indexes_in_background, run_in_transaction, parse_object_id, user_object_id
+from http_helpers import not_modified, parse_json_body, with_etag
+import hashlib
 import logging
+import threading
+import time
+import orjson
 
 logger = logging.getLogger(__name__)
 
 # Initialize blueprint
 material_bp = Blueprint('material', __name__)
 
-# MongoDB connection
-client = pymongo.MongoClient(Config.MONGO_URI)
-db = client.quiz_planner
+def create_indexes(database):
+    """Per-user lookups and newest-first listings, plus the quiz cascade in delete_material"""
+    database.study_materials.create_index([("user_id", 1), ("_id", 1)], background=True)
+    database.study_materials.create_index([("user_id", 1), ("created_at", -1)], background=True)
+    database.quizzes.create_index([("material_id", 1)], background=True)
+
+@material_bp.record_once
+def start_index_build(state):
+    """Build indexes once the blueprint is registered, off the worker's startup path"""
+    build_indexes_in_background("study material", create_indexes)
+
+# Documents fetched per cursor batch when reading a listing
+LIST_BATCH_SIZE = 200
+
+# Concurrent single-material reads for the same user within this window share one $in query.
+# The window is only waited out when other lookups are already in flight, so a lone read never pays it.
+COALESCE_WINDOW = 0.002  # seconds
+# Longest a lookup waits on another request's query; an older queue is treated as abandoned
+LOAD_TIMEOUT = 5  # seconds
+
+_pending_loads = {}   # (user ObjectId, material ObjectId) -> Future
+_queued_loads = {}    # user ObjectId -> (monotonic time queued, material ObjectIds waiting for the next query)
+_loads_lock = threading.Lock()
+
+def load_material(user_oid, material_oid):
+    """Fetch one of the user's materials, coalescing bursts of lookups into a single query"""
+    key = (user_oid, material_oid)
+    with _loads_lock:
+        future = _pending_loads.get(key)
+        leader = wait = False
+        if future is None:
+            future = _pending_loads[key] = Future()
+            entry = _queued_loads.get(user_oid)
+            if entry is None or time.monotonic() - entry[0] > LOAD_TIMEOUT:
+                # First lookup in this window (or after a leader that never flushed) gathers the others
+                entry = _queued_loads[user_oid] = (time.monotonic(), [])
+                leader = True
+                # Nothing else pending means no burst to gather; query straight away
+                wait = len(_pending_loads) > 1
+            queued = entry[1]
+            queued.append(material_oid)
+    
+    if leader:
+        try:
+            if wait:
+                time.sleep(COALESCE_WINDOW)
+        finally:
+            # Resolve the followers even if this request is interrupted during the window
+            _flush_loads(user_oid, queued)
+    
+    try:
+        material = future.result(timeout=LOAD_TIMEOUT)
+    except FutureTimeoutError:
+        # Nobody resolved it; drop it so later lookups start a fresh query
+        with _loads_lock:
+            if _pending_loads.get(key) is future:
+                del _pending_loads[key]
+        raise
+    # Waiters share the fetched document, so hand each one its own copy
+    return dict(material) if material else None
+
+def _flush_loads(user_oid, queued):
+    """Run the batched lookup for a user and resolve every waiting future, failing them if interrupted"""
+    with _loads_lock:
+        if _queued_loads.get(user_oid, (None, None))[1] is queued:
+            del _queued_loads[user_oid]
+        oids = list(queued)
+    
+    found, error = {}, None
+    try:
+        found = {material['_id']: material for material in db.study_materials.find(
+            {"_id": {"$in": oids}, "user_id": user_oid},
+            projection={"content_hash": 0}
+        )}
+    except Exception as e:
+        error = e
+    except BaseException:
+        # e.g. a killed greenlet; followers still get an answer
+        error = RuntimeError("Batched material lookup was interrupted")
+        raise
+    finally:
+        with _loads_lock:
+            futures = [(oid, _pending_loads.pop((user_oid, oid), None)) for oid in oids]
+        for oid, future in futures:
+            if future is None or future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(found.get(oid))
+
+def _list_key(user_id_str):
+    return f"mat:list:{user_id_str}"
+
+def _one_key(user_id_str, material_id):
+    return f"mat:one:{user_id_str}:{material_id}"
+
+def cache_get(key):
+    """Return cached (etag, JSON bytes), or None on a miss or when Redis is unavailable"""
+    if redis_client is None:
+        return None
+    try:
+        entry = redis_client.get(key)
+    except RedisError as e:
+        logger.warning("Material cache lookup failed: %s", e)
+        return None
+    if entry is None:
+        return None
+    # Stored as b"<etag>\n<payload>"; compact JSON never contains a raw newline
+    etag, _, payload = entry.partition(b'\n')
+    return etag.decode(), payload
+
+def cache_set(key, payload, etag):
+    """Store serialized JSON and its ETag for a short while"""
+    if redis_client is None:
+        return
+    try:
+        redis_client.setex(key, Config.MATERIAL_CACHE_TTL, etag.encode() + b'\n' + payload)
+    except RedisError as e:
+        logger.warning("Material cache store failed: %s", e)
+
+def invalidate_materials(user_id_str, material_id=None):
+    """Drop the user's cached listing and, if given, the cached material"""
+    if redis_client is None:
+        return
+    keys = [_list_key(user_id_str)]
+    if material_id:
+        keys.append(_one_key(user_id_str, material_id))
+    try:
+        redis_client.delete(*keys)
+    except RedisError as e:
+        logger.warning("Material cache invalidation failed: %s", e)
+
+def dumps(obj):
+    """Serialize to JSON bytes with orjson; naive datetimes are UTC, ObjectIds become strings"""
+    return orjson.dumps(obj, default=str, option=orjson.OPT_NAIVE_UTC)
+
+def json_response(payload, status=200):
+    """Wrap already-serialized JSON without re-encoding it"""
+    return Response(payload, status=status, mimetype='application/json')
+
+def ojsonify(obj, status=200):
+    """orjson-backed replacement for jsonify"""
+    return json_response(dumps(obj), status)
+
+def material_etag(material):
+    """ETag for one material, from its id and update counter"""
+    return f"{material['_id']}-{material.get('version', 0)}"
+
+def listing_etag(materials):
+    """ETag for a listing, fingerprinting the (id, version) pair of every row it returns"""
+    digest = hashlib.blake2b(digest_size=16)
+    for material in materials:
+        digest.update(f"{material['_id']}-{material.get('version', 0)};".encode())
+    return digest.hexdigest()
+
+def check_body_size():
+    """Reject oversized bodies from the Content-Length header before parsing them"""
+    if request.content_length is not None and request.content_length > Config.MAX_MATERIAL_BYTES:
+        return ojsonify({"error": "Study material is too large"}, 413)
+    return None
+
+def normalize_tags(tags):
+    """Trim and lowercase tags in one pass, dropping blanks"""
+    return [tag for tag in (t.strip().lower() for t in tags) if tag]
+
+def validate_material_fields(data):
+    """Check field types, content size and tag limits, returning an error response or None"""
+    for field in ('title', 'content', 'description'):
+        if field in data and not isinstance(data[field], str):
+            return ojsonify({"error": f"{field.capitalize()} must be a string"}, 400)
+    
+    if 'content' in data and len(data['content']) > Config.MAX_MATERIAL_BYTES:
+        return ojsonify({"error": "Study material is too large"}, 413)
+    
+    if 'tags' in data:
+        tags = data['tags']
+        if not isinstance(tags, list) or len(tags) > Config.MAX_MATERIAL_TAGS:
+            return ojsonify({"error": f"Tags must be a list of at most {Config.MAX_MATERIAL_TAGS} items"}, 400)
+        if any(not isinstance(tag, str) or len(tag) > Config.MAX_TAG_LENGTH for tag in tags):
+            return ojsonify({"error": f"Tags must be strings of at most {Config.MAX_TAG_LENGTH} characters"}, 400)
+    
+    return None
 
 @material_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_material():
     """Create a new study material"""
+    user_id = get_jwt_identity()
+    user_id_str = str(user_id)
+    user_oid = user_object_id(user_id)
+    
     try:
-        user_id = get_jwt_identity()
-        user_id_str = str(user_id)  # Always store as string
+        too_large = check_body_size()
+        if too_large:
+            return too_large
         
-        data = request.get_json()
+        data = parse_json_body()
         
         # Validate input
         if not data or 'title' not in data or 'content' not in data:
-            return jsonify({"error": "Title and content are required"}), 400
+            return ojsonify({"error": "Title and content are required"}, 400)
+        
+        invalid = validate_material_fields(data)
+        if invalid:
+            return invalid
         
         title = data['title'].strip()
         content = data['content']
         
         if not title or not content:
-            return jsonify({"error": "Title and content cannot be empty"}), 400
+            return ojsonify({"error": "Title and content cannot be empty"}, 400)
         
-        # Create new material with string user_id
+        # Create new material owned by the user's ObjectId
         material = {
             "title": title,
             "content": content,
             "description": data.get('description', '').strip(),
-            "tags": data.get('tags', []),
-            "user_id": user_id_str,  # Store as string consistently
-            "created_at": datetime.now()
+            "tags": normalize_tags(data.get('tags', [])),
+            "user_id": user_oid,
+            "created_at": datetime.now(timezone.utc)
         }
         
         material_id = db.study_materials.insert_one(material).inserted_id
         
-        logger.info(f"Created material {material_id} for user {user_id_str}")
+        invalidate_materials(user_id_str)
         
-        return jsonify({
+        logger.debug("Created material %s for user %s", material_id, user_id_str)
+        
+        return ojsonify({
             "message": "Study material created successfully",
             "material": {
                 "id": str(material_id),
                 "title": title
             }
-        }), 201
+        }, 201)
         
     except Exception as e:
-        logger.error(f"Error in create_material: {str(e)}")
-        return jsonify({"error": f"Failed to create material: {str(e)}"}), 500
+        logger.exception("create_material failed")
+        return ojsonify({"error": f"Failed to create material: {str(e)}"}, 500)
 
 @material_bp.route('/', methods=['GET'])
 @jwt_required()
@@ -67,28 +264,38 @@ def get_materials():
     """Get all study materials for the current user"""
     user_id = get_jwt_identity()
     user_id_str = str(user_id)
+    user_oid = user_object_id(user_id)
     
-    logger.info(f"Getting materials for user: {user_id_str}")
+    logger.debug("Getting materials for user: %s", user_id_str)
     
-    # Create query filter that works with both string and ObjectId
-    user_filter = {"$or": [
-        {"user_id": user_id_str},  # For string user_id
-        {"user_id": {"$in": [user_id_str, ObjectId(user_id_str) if ObjectId.is_valid(user_id_str) else None]}}
-    ]}
+    cached = cache_get(_list_key(user_id_str))
+    if cached is not None:
+        etag, payload = cached
+        return not_modified(etag) or with_etag(json_response(payload), etag)
     
-    # Get all materials for the user
-    materials = list(db.study_materials.find(user_filter))
+    # Get all materials for the user (user_id is normalized to an ObjectId by migrate.py).
+    # The listing leaves out content; clients fetch it per material when needed.
+    materials = list(db.study_materials.find(
+        {"user_id": user_oid}, projection={"content": 0, "content_hash": 0}
+    ).sort("_id", 1).batch_size(LIST_BATCH_SIZE))
+    logger.debug("Found %d materials", len(materials))
     
-    logger.info(f"Found {len(materials)} materials")
+    # The ETag comes from the same rows as the body, so a concurrent update can't be served under an old one
+    etag = listing_etag(materials)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
     
-    # Convert ObjectId to string for JSON serialization
     for material in materials:
+        # Convert ObjectId to string for JSON serialization
         material['_id'] = str(material['_id'])
         # Ensure user_id is string in response
         if 'user_id' in material:
             material['user_id'] = str(material['user_id'])
     
-    return jsonify(materials), 200
+    payload = dumps(materials)
+    cache_set(_list_key(user_id_str), payload, etag)
+    return with_etag(json_response(payload), etag)
 
 @material_bp.route('/<material_id>', methods=['GET'])
 @jwt_required()
@@ -96,28 +303,59 @@ def get_material(material_id):
     """Get a specific study material"""
     user_id = get_jwt_identity()
     user_id_str = str(user_id)
+    user_oid = user_object_id(user_id)
     
-    # Validate ObjectId
-    if not ObjectId.is_valid(material_id):
-        return jsonify({"error": "Invalid material ID"}), 400
+    # Parse and validate the id in one step
+    material_oid = parse_object_id(material_id)
+    if material_oid is None:
+        return ojsonify({"error": "Invalid material ID"}, 400)
     
-    material = db.study_materials.find_one({
-        "_id": ObjectId(material_id),
-        "$or": [
-            {"user_id": user_id_str},
-            {"user_id": ObjectId(user_id_str) if ObjectId.is_valid(user_id_str) else None}
-        ]
-    })
+    cached = cache_get(_one_key(user_id_str, material_id))
+    if cached is not None:
+        etag, payload = cached
+        return not_modified(etag) or with_etag(json_response(payload), etag)
+    
+    material = load_material(user_oid, material_oid)
     
     if not material:
-        return jsonify({"error": "Study material not found"}), 404
+        return ojsonify({"error": "Study material not found"}, 404)
+    
+    etag = material_etag(material)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
     
     # Convert ObjectId to string for JSON serialization
     material['_id'] = str(material['_id'])
     if 'user_id' in material:
         material['user_id'] = str(material['user_id'])
     
-    return jsonify(material), 200
+    payload = dumps(material)
+    cache_set(_one_key(user_id_str, material_id), payload, etag)
+    
+    return with_etag(json_response(payload), etag)
+
+@material_bp.route('/<material_id>/content', methods=['GET'])
+@jwt_required()
+def get_material_content(material_id):
+    """Get only the content of a specific study material"""
+    user_id = get_jwt_identity()
+    user_oid = user_object_id(user_id)
+    
+    # Parse and validate the id in one step
+    material_oid = parse_object_id(material_id)
+    if material_oid is None:
+        return ojsonify({"error": "Invalid material ID"}, 400)
+    
+    material = db.study_materials.find_one(
+        {"_id": material_oid, "user_id": user_oid},
+        projection={"_id": 0, "content": 1}
+    )
+    
+    if not material:
+        return ojsonify({"error": "Study material not found"}, 404)
+    
+    return ojsonify({"content": material.get('content', '')}, 200)
 
 @material_bp.route('/<material_id>', methods=['PUT'])
 @jwt_required()
@@ -125,34 +363,33 @@ def update_material(material_id):
     """Update a study material"""
     user_id = get_jwt_identity()
     user_id_str = str(user_id)
+    user_oid = user_object_id(user_id)
+    
+    too_large = check_body_size()
+    if too_large:
+        return too_large
     
-    data = request.get_json()
+    data = parse_json_body()
     
     # Validate input
     if not data:
-        return jsonify({"error": "No update data provided"}), 400
-    
-    # Validate ObjectId
-    if not ObjectId.is_valid(material_id):
-        return jsonify({"error": "Invalid material ID"}), 400
+        return ojsonify({"error": "No update data provided"}, 400)
     
-    # Check if material exists and belongs to user
-    material = db.study_materials.find_one({
-        "_id": ObjectId(material_id),
-        "$or": [
-            {"user_id": user_id_str},
-            {"user_id": ObjectId(user_id_str) if ObjectId.is_valid(user_id_str) else None}
-        ]
-    })
+    invalid = validate_material_fields(data)
+    if invalid:
+        return invalid
     
-    if not material:
-        return jsonify({"error": "Study material not found"}), 404
+    # Parse and validate the id in one step
+    material_oid = parse_object_id(material_id)
+    if material_oid is None:
+        return ojsonify({"error": "Invalid material ID"}, 400)
     
     # Update fields
     update_data = {}
     
-    if 'title' in data and data['title'].strip():
-        update_data['title'] = data['title'].strip()
+    title = data['title'].strip() if 'title' in data else ''
+    if title:
+        update_data['title'] = title
     
     if 'content' in data:
         update_data['content'] = data['content']
@@ -161,20 +398,32 @@ def update_material(material_id):
         update_data['description'] = data['description'].strip()
     
     if 'tags' in data:
-        update_data['tags'] = data['tags']
+        update_data['tags'] = normalize_tags(data['tags'])
     
     if not update_data:
-        return jsonify({"message": "No fields to update"}), 200
+        return ojsonify({"message": "No fields to update"}, 200)
+    
+    # Fingerprint the change so a resent identical update is skipped instead of rewritten
+    update_hash = hashlib.blake2b(orjson.dumps(update_data, option=orjson.OPT_SORT_KEYS), digest_size=16).digest()
     
-    # Update material
-    db.study_materials.update_one(
-        {"_id": ObjectId(material_id)},
-        {"$set": update_data}
+    # Update material; the ownership filter doubles as the existence check
+    material = db.study_materials.find_one_and_update(
+        {"_id": material_oid, "user_id": user_oid, "content_hash": {"$ne": update_hash}},
+        {"$set": {**update_data, "content_hash": update_hash}, "$inc": {"version": 1}},
+        projection={"_id": 1}
     )
     
-    logger.info(f"Updated material {material_id} for user {user_id_str}")
+    if not material:
+        # Either missing or already up to date with exactly this update
+        if not db.study_materials.find_one({"_id": material_oid, "user_id": user_oid}, projection={"_id": 1}):
+            return ojsonify({"error": "Study material not found"}, 404)
+        return ojsonify({"message": "Study material updated successfully"}, 200)
+    
+    invalidate_materials(user_id_str, material_id)
     
-    return jsonify({"message": "Study material updated successfully"}), 200
+    logger.debug("Updated material %s for user %s", material_id, user_id_str)
+    
+    return ojsonify({"message": "Study material updated successfully"}, 200)
 
 @material_bp.route('/<material_id>', methods=['DELETE'])
 @jwt_required()
@@ -182,29 +431,29 @@ def delete_material(material_id):
     """Delete a study material"""
     user_id = get_jwt_identity()
     user_id_str = str(user_id)
+    user_oid = user_object_id(user_id)
     
-    # Validate ObjectId
-    if not ObjectId.is_valid(material_id):
-        return jsonify({"error": "Invalid material ID"}), 400
-    
-    # Check if material exists and belongs to user
-    material = db.study_materials.find_one({
-        "_id": ObjectId(material_id),
-        "$or": [
-            {"user_id": user_id_str},
-            {"user_id": ObjectId(user_id_str) if ObjectId.is_valid(user_id_str) else None}
-        ]
-    })
+    # Parse and validate the id in one step
+    material_oid = parse_object_id(material_id)
+    if material_oid is None:
+        return ojsonify({"error": "Invalid material ID"}, 400)
     
-    if not material:
-        return jsonify({"error": "Study material not found"}), 404
+    def delete_with_quizzes(session):
+        # The ownership filter doubles as the existence check
+        deleted = db.study_materials.delete_one(
+            {"_id": material_oid, "user_id": user_oid}, session=session
+        ).deleted_count
+        if deleted:
+            # Also delete any quizzes related to this material
+            db.quizzes.delete_many({"material_id": str(material_id)}, session=session)
+        return deleted
     
-    # Delete material
-    db.study_materials.delete_one({"_id": ObjectId(material_id)})
+    # Delete the material and its quizzes atomically
+    if not run_in_transaction(delete_with_quizzes):
+        return ojsonify({"error": "Study material not found"}, 404)
     
-    # Also delete any quizzes related to this material
-    db.quizzes.delete_many({"material_id": str(material_id)})
+    invalidate_materials(user_id_str, material_id)
     
-    logger.info(f"Deleted material {material_id} for user {user_id_str}")
+    logger.debug("Deleted material %s for user %s", material_id, user_id_str)
     
-    return jsonify({"message": "Study material deleted successfully"}), 200
\ No newline at end of file
+    return ojsonify({"message": "Study material deleted successfully"}, 200)
\ No newline at end of file
@@ -1,51 +1,297 @@
 import os
 import sys
 from pathlib import Path
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from bson.objectid import ObjectId
-import pymongo
-from datetime import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
+from datetime import datetime, timedelta, timezone
 from config import Config
+from db import db, build_indexes_in_background, run_in_transaction, parse_object_id, user_object_id
+from http_helpers import not_modified, parse_json_body, with_etag
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
 # Initialize blueprint
 quiz_bp = Blueprint('quiz', __name__)
 
-# MongoDB connection
-client = pymongo.MongoClient(Config.MONGO_URI)
-db = client.quiz_planner
-
 # Add parent directory to path to ensure imports work properly
 current_dir = Path(__file__).parent
 parent_dir = current_dir.parent
 sys.path.append(str(parent_dir))
 
-# Import and initialize the question generator
-try:
-    from ai.question_generator import QuestionGenerator
-    question_generator = QuestionGenerator()
-    logger.info("QuestionGenerator initialized successfully")
-except Exception as e:
-    logger.error(f"Error initializing QuestionGenerator: {e}")
-    question_generator = None
+from ai import cache as question_cache
+from ai.question_generator import get_generator
+
+# Seconds clients are told to wait when the question generator can't be initialized
+GENERATOR_RETRY_AFTER = 30
+
+# Background pool for async quiz generation, so Gemini calls don't hold request workers
+generation_executor = ThreadPoolExecutor(max_workers=Config.GENERATION_WORKERS,
+                                         thread_name_prefix="quiz-gen")
+
+def create_indexes(database):
+    """Per-user newest-first listings (optionally for one material or quiz), served in index order"""
+    # _id is the NEWEST_FIRST tie-breaker, so it ends each key for sorts and keyset seeks without a SORT stage
+    database.quizzes.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+    database.quizzes.create_index([("user_id", 1), ("material_id", 1), ("created_at", -1), ("_id", -1)])
+    database.quiz_attempts.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+    # Its (quiz_id, user_id) prefix also serves attempt counts and deletes
+    database.quiz_attempts.create_index([("quiz_id", 1), ("user_id", 1), ("created_at", -1), ("_id", -1)])
+    # Word search on titles goes through text indexes rather than unanchored regex scans
+    database.quizzes.create_index([("title", "text"), ("description", "text")])
+    database.quiz_attempts.create_index([("quiz_title", "text")])
+    question_cache.create_indexes(database)
+
+@quiz_bp.record_once
+def start_index_build(state):
+    """Build indexes once the blueprint is registered, off the worker's startup path"""
+    build_indexes_in_background("quiz", create_indexes)
+
+def load_question_generator():
+    """The shared question generator, or None if it failed to initialize (retried on the next call)"""
+    try:
+        return get_generator()
+    except Exception:
+        logger.exception("Error initializing QuestionGenerator")
+        return None
+
+def generator_unavailable():
+    """503 telling the client to retry once the question generator can be initialized"""
+    response = jsonify({"error": "Question generator not available"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(GENERATOR_RETRY_AFTER)
+    return response
+
+def preflight_response():
+    """Empty 204 for preflights; flask-cors adds the CORS headers, including Access-Control-Max-Age"""
+    return Response(status=204)
 
 def get_user_filter(user_id):
-    """Create a filter that handles both string and ObjectId user_id formats"""
-    user_id_str = str(user_id)
-    return {"$or": [
-        {"user_id": user_id_str},
-        {"user_id": ObjectId(user_id_str) if ObjectId.is_valid(user_id_str) else None}
-    ]}
+    """Create the owner filter; quiz and attempt user_ids are stored as strings (see migrate.py)"""
+    return {"user_id": str(user_id)}
+
+# Stand-in for documents missing a timestamp
+_EPOCH = datetime(1970, 1, 1)
+
+# Fixed parts of the list queries; per request only the filter values and page bounds change
+NEWEST_FIRST = {"created_at": -1, "_id": -1}
+BEST_MATCH_FIRST = {"text_score": {"$meta": "textScore"}, "created_at": -1}
+QUIZ_LIST_PROJECTION = {
+    "title": 1,
+    "description": 1,
+    "created_at": 1,
+    "material_id": 1,
+    "num_questions": 1,
+    "attempt_count": 1
+}
+ATTEMPT_LIST_PROJECTION = {"results": 0, "answers": 0}
+GRADING_PROJECTION = {
+    "title": 1,
+    "answer_key": 1,
+    "questions.type": 1,
+    "questions.correct_answer": 1,
+    "questions.explanation": 1
+}
+
+def page_params():
+    """Read ?page= and ?limit=, clamping limit to MAX_PAGE_SIZE; returns (page, limit, skip)"""
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = min(max(int(request.args.get('limit', 10)), 1), Config.MAX_PAGE_SIZE)
+    except ValueError:
+        page, limit = 1, 10
+    return page, limit, (page - 1) * limit
+
+def page_response(key, rows, total, page, limit, has_next, next_cursor=None):
+    """Encode a paginated listing in one orjson call; pages are capped at MAX_PAGE_SIZE rows.
+    orjson writes datetimes natively (naive ones as UTC) and ObjectIds fall back to str."""
+    pagination = {
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "pages": (total + limit - 1) // limit if total is not None else None,
+        "has_next": has_next,
+        "next_cursor": next_cursor
+    }
+    body = {key: list(rows), "pagination": pagination}
+    return Response(orjson.dumps(body, default=str, option=orjson.OPT_NAIVE_UTC), mimetype='application/json')
+
+def wants_total():
+    """Clients paging with next/previous only can pass ?include_total=false to skip the count"""
+    return request.args.get('include_total', 'true').lower() != 'false'
+
+class InvalidCursor(ValueError):
+    """Raised when a request carries a malformed after/after_id keyset cursor"""
+
+@quiz_bp.errorhandler(InvalidCursor)
+def invalid_cursor_error(error):
+    return jsonify({"error": "Invalid page cursor"}), 400
+
+def parse_page_cursor():
+    """Read the ?after=<created_at>&after_id=<id> keyset cursor; None when absent.
+    A cursor that is present but malformed raises InvalidCursor rather than silently restarting at page 1."""
+    after = request.args.get('after')
+    after_id = request.args.get('after_id')
+    if after is None and after_id is None:
+        return None
+    after_oid = parse_object_id(after_id)
+    if not after or after_oid is None:
+        raise InvalidCursor(after, after_id)
+    try:
+        return datetime.fromisoformat(after.replace('Z', '+00:00')), after_oid
+    except ValueError:
+        raise InvalidCursor(after, after_id)
+
+def format_cursor_time(value):
+    """Millisecond UTC timestamp with a Z suffix - exact for BSON dates and free of '+', which
+    an unencoded query string would turn into a space"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec='milliseconds') + 'Z'
+
+def next_page_cursor(rows, has_next):
+    """Keyset cursor for the page after a newest-first page, or None on the last page"""
+    if not has_next:
+        return None
+    last = rows[-1]
+    return {"after": format_cursor_time(last.get('created_at', _EPOCH)), "after_id": str(last['_id'])}
+
+def fetch_page(collection, query_filter, sort, skip, limit, project=None, after=None, count=True):
+    """One sorted page plus, unless count is False, the total match count; returns (total, rows, has_next).
+    One extra row is read to tell whether another page follows.
+    With an `after` (created_at, _id) cursor the newest-first page starts from an index seek
+    past that document instead of skipping over every earlier row."""
+    if after is not None:
+        created_at, after_id = after
+        page_filter = {**query_filter, "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": after_id}}
+        ]}
+        rows = list(collection.find(page_filter, project).sort(list(NEWEST_FIRST.items())).limit(limit + 1))
+        total = collection.count_documents(query_filter) if count else None
+        return total, rows[:limit], len(rows) > limit
+    
+    page_stages = [{"$sort": sort}, {"$skip": skip}, {"$limit": limit + 1}]
+    if project:
+        page_stages.append({"$project": project})
+    
+    if not count:
+        rows = list(collection.aggregate([{"$match": query_filter}] + page_stages))
+        return None, rows[:limit], len(rows) > limit
+    
+    # Count and page in a single $facet query
+    result = next(collection.aggregate([
+        {"$match": query_filter},
+        {"$facet": {"total": [{"$count": "n"}], "rows": page_stages}}
+    ]))
+    total = result["total"][0]["n"] if result["total"] else 0
+    rows = result["rows"]
+    return total, rows[:limit], len(rows) > limit
+
+def save_quiz(user_id_str, material, questions, title=None, description=None):
+    """Insert a generated quiz for a study material and return the stored document"""
+    # Create quiz document with string user_id and material_id
+    now = datetime.now(timezone.utc)
+    quiz = {
+        "title": title or f"Quiz on {material['title']}",
+        "description": description or f"Generated quiz based on {material['title']}",
+        "questions": questions,
+        "num_questions": len(questions),  # Lets listings skip the questions array
+        "answer_key": build_answer_key(questions),
+        "attempt_count": 0,
+        "user_id": user_id_str,  # Store as string
+        "material_id": str(material['_id']),  # Store as string
+        "created_at": now,
+        "updated_at": now
+    }
+    
+    db.quizzes.insert_one(quiz)
+    return quiz
+
+def is_stale(started_at):
+    """True once background work started at started_at has outlived GENERATION_TIMEOUT"""
+    if started_at is None:
+        return True
+    if started_at.tzinfo is None:
+        started_at = started_at.replace(tzinfo=timezone.utc)  # PyMongo hands back naive UTC
+    return datetime.now(timezone.utc) - started_at > timedelta(seconds=Config.GENERATION_TIMEOUT)
+
+def save_batch_quizzes(batch, results):
+    """Save a claimed batch's quizzes in the background, regenerating entries that failed inside it.
+    Each quiz is recorded on the batch as soon as it is saved, so a re-claim skips it."""
+    saved = set(batch.get('saved_material_ids', []))
+    try:
+        materials = db.study_materials.find({
+            "_id": {"$in": [parse_object_id(mid) for mid in batch['material_ids'] if mid not in saved]}
+        })
+        for material in materials:
+            material_id = str(material['_id'])
+            questions = results.get(material_id)
+            if not questions:
+                # Entry failed inside the batch; fall back to a regular generation
+                questions = get_generator().generate_questions(
+                    material['content'],
+                    num_questions=batch['num_questions'],
+                    question_types=batch['question_types'],
+                    service_tier=Config.GEMINI_BACKGROUND_SERVICE_TIER
+                )
+            quiz = save_quiz(batch['user_id'], material, questions)
+            db.quiz_batches.update_one(
+                {"_id": batch['_id']},
+                {"$push": {"quiz_ids": str(quiz['_id']), "saved_material_ids": material_id}}
+            )
+    except Exception as e:
+        logger.error("Failed to save quiz batch %s: %s", batch['batch_name'], e)
+        db.quiz_batches.update_one({"_id": batch['_id']}, {"$set": {"status": "failed", "error": str(e)}})
+        return
+    
+    db.quiz_batches.update_one(
+        {"_id": batch['_id']},
+        {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc)}}
+    )
+    logger.info("Saved quizzes from batch %s", batch['batch_name'])
+
+def run_generation_task(task_id, user_id_str, material, num_questions, question_types, title, description):
+    """Generate and save a quiz in the background, recording the outcome on the task"""
+    db.quiz_tasks.update_one({"_id": task_id}, {"$set": {"status": "running", "updated_at": datetime.now(timezone.utc)}})
+    
+    try:
+        questions = get_generator().generate_questions(
+            material['content'],
+            num_questions=num_questions,
+            question_types=question_types
+        )
+        quiz = save_quiz(user_id_str, material, questions, title, description)
+    except Exception as e:
+        logger.error("Quiz generation task %s failed: %s", task_id, e)
+        db.quiz_tasks.update_one(
+            {"_id": task_id},
+            {"$set": {"status": "failed", "error": str(e), "updated_at": datetime.now(timezone.utc)}}
+        )
+        return
+    
+    db.quiz_tasks.update_one(
+        {"_id": task_id},
+        {"$set": {
+            "status": "completed",
+            "quiz_id": str(quiz['_id']),
+            "title": quiz['title'],
+            "num_questions": len(questions),
+            "updated_at": datetime.now(timezone.utc)
+        }}
+    )
+    logger.info("Generated quiz %s for user %s in task %s", quiz['_id'], user_id_str, task_id)
 
 @quiz_bp.route('/generate', methods=['POST'])
 @jwt_required()
 def generate_quiz():
     """Generate a quiz from study material"""
+    question_generator = load_question_generator()
     if not question_generator:
-        return jsonify({"error": "Question generator not available"}), 500
+        return generator_unavailable()
     
     user_id = get_jwt_identity()
     user_id_str = str(user_id)  # Always store as string
@@ -58,8 +304,9 @@ def generate_quiz():
     
     material_id = data['material_id']
     
-    # Validate ObjectId
-    if not ObjectId.is_valid(material_id):
+    # Parse and validate the id in one step
+    material_oid = parse_object_id(material_id)
+    if material_oid is None:
         return jsonify({"error": "Invalid material ID"}), 400
     
     # Get parameters
@@ -67,49 +314,232 @@ def generate_quiz():
     question_types = data.get('question_types', ["multiple_choice", "true_false", "short_answer"])
     
     # Get study material
-    user_filter = get_user_filter(user_id)
-    material = db.study_materials.find_one({
-        "_id": ObjectId(material_id),
-        "$or": user_filter["$or"]
-    })
+    material = db.study_materials.find_one({"_id": material_oid, "user_id": user_object_id(user_id)})
     
     if not material:
         return jsonify({"error": "Study material not found"}), 404
     
+    # Queue slow generations and return at once; cache hits still complete synchronously
+    if data.get('async') and Config.GEMINI_API_KEY and not question_generator.get_cached_questions(
+            material['content'], num_questions, question_types):
+        now = datetime.now(timezone.utc)
+        task = {
+            "user_id": user_id_str,
+            "material_id": str(material['_id']),
+            "status": "pending",
+            "created_at": now,
+            "updated_at": now
+        }
+        task_id = db.quiz_tasks.insert_one(task).inserted_id
+        generation_executor.submit(
+            run_generation_task, task_id, user_id_str, material,
+            num_questions, question_types, data.get('title'), data.get('description')
+        )
+        
+        return jsonify({
+            "message": "Quiz generation started",
+            "task_id": str(task_id),
+            "status": "pending"
+        }), 202
+    
     # Generate questions
     try:
-        questions = question_generator.generate_questions(
+        questions, cache_hit = question_generator.generate_questions(
             material['content'],
             num_questions=num_questions,
-            question_types=question_types
+            question_types=question_types,
+            return_cache_status=True
         )
         
-        # Create quiz document with string user_id and material_id
-        quiz = {
-            "title": data.get('title', f"Quiz on {material['title']}"),
-            "description": data.get('description', f"Generated quiz based on {material['title']}"),
-            "questions": questions,
-            "user_id": user_id_str,  # Store as string
-            "material_id": str(material_id),  # Store as string
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
-        }
+        quiz = save_quiz(user_id_str, material, questions, data.get('title'), data.get('description'))
+        quiz_id = quiz['_id']
         
-        quiz_id = db.quizzes.insert_one(quiz).inserted_id
+        logger.info("Generated quiz %s for user %s", quiz_id, user_id_str)
         
-        logger.info(f"Generated quiz {quiz_id} for user {user_id_str}")
-        
-        return jsonify({
+        response = jsonify({
             "message": "Quiz generated successfully",
             "quiz_id": str(quiz_id),
             "title": quiz["title"],
             "num_questions": len(questions)
-        }), 201
+        })
+        response.headers['X-Cache'] = 'HIT' if cache_hit else 'MISS'
+        return response, 201
     
     except Exception as e:
-        logger.error(f"Failed to generate quiz: {str(e)}")
+        logger.error("Failed to generate quiz: %s", e)
         return jsonify({"error": f"Failed to generate quiz: {str(e)}"}), 500
 
+@quiz_bp.route('/status/<task_id>', methods=['GET'])
+@jwt_required()
+def get_generation_status(task_id):
+    """Get the state of an async quiz generation task"""
+    user_id = get_jwt_identity()
+    
+    task_oid = parse_object_id(task_id)
+    if task_oid is None:
+        return jsonify({"error": "Invalid task ID"}), 400
+    
+    task = db.quiz_tasks.find_one({"_id": task_oid, "user_id": str(user_id)})
+    
+    if not task:
+        return jsonify({"error": "Task not found"}), 404
+    
+    # Tasks only live in this process's executor; one that outlived the timeout was lost to a restart
+    if task['status'] in ("pending", "running") and is_stale(task.get('updated_at')):
+        task['status'] = "failed"
+        task['error'] = "Quiz generation timed out"
+        db.quiz_tasks.update_one(
+            {"_id": task['_id'], "status": {"$in": ["pending", "running"]}, "updated_at": task.get('updated_at')},
+            {"$set": {"status": "failed", "error": task['error'], "updated_at": datetime.now(timezone.utc)}}
+        )
+    
+    result = {
+        "task_id": str(task['_id']),
+        "status": task['status']
+    }
+    if task['status'] == "completed":
+        result.update(quiz_id=task['quiz_id'], title=task['title'], num_questions=task['num_questions'])
+    elif task['status'] == "failed":
+        result['error'] = task.get('error', 'Quiz generation failed')
+    
+    return jsonify(result), 200
+
+@quiz_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def generate_quiz_batch():
+    """Queue quiz generation for several materials through the Gemini Batch API"""
+    question_generator = load_question_generator()
+    if not question_generator:
+        return generator_unavailable()
+    
+    if not Config.GEMINI_API_KEY:
+        return jsonify({"error": "Batch generation requires a configured Gemini API key"}), 503
+    
+    user_id = get_jwt_identity()
+    user_id_str = str(user_id)
+    
+    data = request.get_json()
+    
+    # Validate input
+    if not data or not isinstance(data.get('material_ids'), list) or not data['material_ids']:
+        return jsonify({"error": "A list of material IDs is required"}), 400
+    
+    material_ids = data['material_ids']
+    material_oids = [parse_object_id(mid) for mid in material_ids]
+    if None in material_oids:
+        return jsonify({"error": "Invalid material ID"}), 400
+    
+    # Get parameters
+    num_questions = data.get('num_questions', 5)
+    question_types = data.get('question_types', ["multiple_choice", "true_false", "short_answer"])
+    
+    # Get study materials
+    materials = list(db.study_materials.find({
+        "_id": {"$in": material_oids},
+        "user_id": user_object_id(user_id)
+    }))
+    
+    if len(materials) != len(set(material_ids)):
+        return jsonify({"error": "Study material not found"}), 404
+    
+    try:
+        batch_name = question_generator.submit_batch(
+            [(str(material['_id']), material['content']) for material in materials],
+            num_questions=num_questions,
+            question_types=question_types
+        )
+    except Exception as e:
+        logger.error("Failed to submit quiz batch: %s", e)
+        return jsonify({"error": f"Failed to submit quiz batch: {str(e)}"}), 502
+    
+    batch = {
+        "batch_name": batch_name,
+        "user_id": user_id_str,
+        "material_ids": [str(material['_id']) for material in materials],
+        "num_questions": num_questions,
+        "question_types": question_types,
+        "status": "pending",
+        "quiz_ids": [],
+        "created_at": datetime.now(timezone.utc)
+    }
+    batch_id = db.quiz_batches.insert_one(batch).inserted_id
+    
+    logger.info("Submitted quiz batch %s for user %s", batch_name, user_id_str)
+    
+    return jsonify({
+        "message": "Quiz batch submitted successfully",
+        "batch_id": str(batch_id),
+        "status": "pending"
+    }), 202
+
+@quiz_bp.route('/batch/<batch_id>', methods=['GET'])
+@jwt_required()
+def get_quiz_batch(batch_id):
+    """Check a quiz batch, saving its quizzes once Gemini has finished the job"""
+    user_id = get_jwt_identity()
+    user_id_str = str(user_id)
+    
+    batch_oid = parse_object_id(batch_id)
+    if batch_oid is None:
+        return jsonify({"error": "Invalid batch ID"}), 400
+    
+    batch = db.quiz_batches.find_one({"_id": batch_oid, "user_id": user_id_str})
+    
+    if not batch:
+        return jsonify({"error": "Quiz batch not found"}), 404
+    
+    # A batch still "saving" after the timeout lost its worker and can be claimed again
+    reclaimable = batch['status'] == "saving" and is_stale(batch.get('claimed_at'))
+    if batch['status'] == "pending" or reclaimable:
+        question_generator = load_question_generator()
+        if not question_generator:
+            return generator_unavailable()
+        
+        try:
+            state, results = question_generator.get_batch_results(batch['batch_name'], batch['num_questions'])
+        except Exception as e:
+            logger.error("Failed to poll quiz batch %s: %s", batch['batch_name'], e)
+            return jsonify({"error": f"Failed to check quiz batch: {str(e)}"}), 502
+        
+        # Claim the batch so concurrent polls don't save the same quizzes twice
+        claimed = state != "pending" and db.quiz_batches.update_one(
+            {"_id": batch['_id'], "status": batch['status'], "claimed_at": batch.get('claimed_at')},
+            {"$set": {"status": "saving", "claimed_at": datetime.now(timezone.utc)}}
+        ).modified_count == 1
+        
+        if claimed and state == "failed":
+            db.quiz_batches.update_one({"_id": batch['_id']}, {"$set": {"status": "failed"}})
+            batch['status'] = "failed"
+        elif claimed:
+            # Saving can mean regenerating failed entries, so keep it out of the request
+            generation_executor.submit(save_batch_quizzes, batch, results)
+            batch['status'] = "saving"
+    
+    result = {
+        "batch_id": str(batch['_id']),
+        "status": batch['status'],
+        "material_ids": batch['material_ids'],
+        "quiz_ids": batch.get('quiz_ids', [])
+    }
+    if batch['status'] == "failed":
+        result['error'] = batch.get('error', 'Quiz batch failed')
+    
+    return jsonify(result), 200
+
+def format_quiz_row(quiz, material_titles):
+    """One quiz listing row; page_response writes the ObjectId and datetime itself"""
+    quiz_material_id = str(quiz.get('material_id', ''))
+    return {
+        "id": quiz['_id'],
+        "title": quiz.get('title', 'Untitled'),
+        "description": quiz.get('description', ''),
+        "num_questions": quiz.get('num_questions', 0),
+        "created_at": quiz.get('created_at', _EPOCH),
+        "material_id": quiz_material_id,
+        "material_title": material_titles.get(quiz_material_id, 'Unknown'),
+        "attempt_count": quiz.get('attempt_count', 0)
+    }
+
 @quiz_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_all_quizzes():
@@ -118,9 +548,7 @@ def get_all_quizzes():
     user_filter = get_user_filter(user_id)
     
     # Pagination parameters
-    page = int(request.args.get('page', 1))
-    limit = int(request.args.get('limit', 10))
-    skip = (page - 1) * limit
+    page, limit, skip = page_params()
     
     # Filtering parameters
     search_query = request.args.get('search', '')
@@ -131,65 +559,36 @@ def get_all_quizzes():
     
     # Add search filter if provided
     if search_query:
-        query_filter["$and"] = [
-            {"$or": query_filter["$or"]},
-            {"$or": [
-                {"title": {"$regex": search_query, "$options": "i"}},
-                {"description": {"$regex": search_query, "$options": "i"}}
-            ]}
-        ]
-        del query_filter["$or"]
+        query_filter["$text"] = {"$search": search_query}
     
     # Add material filter if provided
-    if material_id and ObjectId.is_valid(material_id):
-        if "$and" in query_filter:
-            query_filter["$and"].append({"material_id": material_id})
-        else:
-            query_filter["$and"] = [
-                {"$or": query_filter["$or"]},
-                {"material_id": material_id}
-            ]
-            del query_filter["$or"]
-    
-    # Count total for pagination
-    total_quizzes = db.quizzes.count_documents(query_filter)
-    
-    # Get quizzes with pagination
-    quizzes = list(db.quizzes.find(query_filter).sort("created_at", -1).skip(skip).limit(limit))
-    
-    # Convert ObjectId to string and format response
-    formatted_quizzes = []
-    for quiz in quizzes:
-        # Get related material info
-        material = None
-        if quiz.get('material_id'):
-            material = db.study_materials.find_one({"_id": ObjectId(quiz['material_id'])})
-        
-        # Get attempt count
-        attempt_filter = user_filter.copy()
-        attempt_filter["quiz_id"] = str(quiz['_id'])
-        attempt_count = db.quiz_attempts.count_documents(attempt_filter)
-        
-        formatted_quizzes.append({
-            "id": str(quiz['_id']),
-            "title": quiz.get('title', 'Untitled'),
-            "description": quiz.get('description', ''),
-            "num_questions": len(quiz.get('questions', [])),
-            "created_at": quiz.get('created_at', datetime.now()).isoformat(),
-            "material_id": str(quiz.get('material_id', '')),
-            "material_title": material.get('title', 'Unknown') if material else "Unknown",
-            "attempt_count": attempt_count
-        })
-    
-    return jsonify({
-        "quizzes": formatted_quizzes,
-        "pagination": {
-            "total": total_quizzes,
-            "page": page,
-            "limit": limit,
-            "pages": (total_quizzes + limit - 1) // limit
+    if material_id and parse_object_id(material_id):
+        query_filter["material_id"] = material_id
+    
+    # Get the total and the page of quizzes, best text matches first when searching;
+    # only the length of the questions array is returned
+    # Keyset cursors follow the newest-first order, so they don't apply to searches
+    sort = BEST_MATCH_FIRST if search_query else NEWEST_FIRST
+    after = None if search_query else parse_page_cursor()
+    total_quizzes, quizzes, has_next = fetch_page(db.quizzes, query_filter, sort, skip, limit,
+                                                  QUIZ_LIST_PROJECTION, after, wants_total())
+    
+    # Look up the titles of all materials on the page in one query
+    material_ids = list({parse_object_id(quiz.get('material_id')) for quiz in quizzes} - {None})
+    material_titles = {}
+    if material_ids:
+        material_titles = {
+            str(material['_id']): material.get('title', 'Unknown')
+            for material in db.study_materials.find(
+                {"_id": {"$in": material_ids}, "user_id": user_object_id(user_id)},
+                {"title": 1}
+            )
         }
-    }), 200
+    
+    formatted_quizzes = [format_quiz_row(quiz, material_titles) for quiz in quizzes]
+    
+    return page_response("quizzes", formatted_quizzes, total_quizzes, page, limit, has_next,
+                       None if search_query else next_page_cursor(quizzes, has_next))
 
 @quiz_bp.route('/<quiz_id>', methods=['GET'])
 @jwt_required()
@@ -198,133 +597,148 @@ def get_quiz(quiz_id):
     user_id = get_jwt_identity()
     user_filter = get_user_filter(user_id)
     
-    logger.info(f"Getting quiz {quiz_id} for user {user_id}")
+    logger.debug("Getting quiz %s for user %s", quiz_id, user_id)
     
-    if not ObjectId.is_valid(quiz_id):
-        logger.warning(f"Invalid quiz ID format: {quiz_id}")
+    quiz_oid = parse_object_id(quiz_id)
+    if quiz_oid is None:
+        logger.warning("Invalid quiz ID format: %s", quiz_id)
         return jsonify({"error": "Invalid quiz ID"}), 400
     
-    # Find the quiz
+    # Find the quiz; the grading key stays server-side
     quiz = db.quizzes.find_one({
-        "_id": ObjectId(quiz_id),
-        "$or": user_filter["$or"]
-    })
+        "_id": quiz_oid,
+        **user_filter
+    }, {"answer_key": 0})
     
     if not quiz:
-        logger.warning(f"Quiz {quiz_id} not found for user {user_id}")
+        logger.warning("Quiz %s not found for user %s", quiz_id, user_id)
         return jsonify({"error": "Quiz not found"}), 404
     
     # Get material info
     material = None
-    if quiz.get('material_id'):
-        material = db.study_materials.find_one({"_id": ObjectId(quiz['material_id'])})
-    
-    # Get attempt count
-    attempt_filter = user_filter.copy()
-    attempt_filter["quiz_id"] = str(quiz['_id'])
-    attempt_count = db.quiz_attempts.count_documents(attempt_filter)
-    
-    # Convert ObjectId to string and format dates
+    material_oid = parse_object_id(quiz.get('material_id'))
+    if material_oid:
+        material = db.study_materials.find_one({"_id": material_oid}, {"title": 1, "version": 1})
+    
+    # Attempts are counted on the quiz as they are submitted
+    attempt_count = quiz.get('attempt_count', 0)
+    
+    # The response only changes with the quiz, its material's title or the attempt count,
+    # so a client holding this version gets a 304 without the questions being re-encoded
+    updated_at = quiz.get('updated_at', _EPOCH)
+    etag = f"{quiz['_id']}-{updated_at.timestamp():.0f}-{material.get('version', 0) if material else 0}-{attempt_count}"
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+    
+    # Convert ObjectId to string and fill in missing dates
     quiz['_id'] = str(quiz['_id'])
     quiz['material_id'] = str(quiz.get('material_id', ''))
-    quiz['created_at'] = quiz.get('created_at', datetime.now()).isoformat()
-    quiz['updated_at'] = quiz.get('updated_at', datetime.now()).isoformat()
+    quiz.setdefault('created_at', _EPOCH)
+    quiz.setdefault('updated_at', _EPOCH)
     
     # Add extra info
     quiz['material_title'] = material.get('title', 'Unknown') if material else "Unknown"
     quiz['attempt_count'] = attempt_count
     
-    return jsonify(quiz), 200
+    return with_etag(jsonify(quiz), etag)
+
+def _as_bool(value):
+    """Interpret a true/false answer given as a bool or a 'true'/'false' string"""
+    return value.lower() == 'true' if isinstance(value, str) else bool(value)
+
+def _normalize_text(value):
+    """Case- and whitespace-insensitive form of a short answer"""
+    return value.lower().strip() if isinstance(value, str) else value
+
+# How each question type puts an answer in comparable form; both sides must match after it
+ANSWER_NORMALIZERS = {
+    "multiple_choice": lambda value: value,
+    "true_false": _as_bool,
+    "short_answer": _normalize_text,
+}
+
+def build_answer_key(questions):
+    """Normalize every correct answer once, so grading only has to normalize the submission"""
+    return [
+        ANSWER_NORMALIZERS[question['type']](question['correct_answer'])
+        if question.get('type') in ANSWER_NORMALIZERS else None
+        for question in questions
+    ]
+
+def grade_answers(questions, answers, answer_key=None):
+    """Grade answers keyed by question index, returning (score, results).
+    The submission is normalized once, then compared against the key in a single zipped pass."""
+    # Quizzes saved before answer keys were stored get one built on the fly
+    if answer_key is None or len(answer_key) != len(questions):
+        answer_key = build_answer_key(questions)
+    
+    # Unanswered questions and unknown types normalize to None and count as wrong
+    normalizers = [ANSWER_NORMALIZERS.get(question['type']) for question in questions]
+    submitted = [answers.get(str(i)) for i in range(len(questions))]  # Use index as question ID
+    correct = [
+        answer is not None and normalize is not None and normalize(answer) == expected
+        for answer, normalize, expected in zip(submitted, normalizers, answer_key)
+    ]
+    
+    results = [{
+        "question_id": i,
+        "correct": is_correct,
+        "correct_answer": question['correct_answer'],
+        "explanation": question.get('explanation', '')
+    } for i, (question, is_correct) in enumerate(zip(questions, correct))]
+    
+    return sum(correct), results
 
 @quiz_bp.route('/<quiz_id>/attempt', methods=['OPTIONS'])
 def quiz_attempt_options(quiz_id):
     """Handle OPTIONS request for quiz attempt endpoint"""
-    response = jsonify({'status': 'ok'})
-    return response
+    return preflight_response()
 
 @quiz_bp.route('/<quiz_id>/attempt', methods=['POST'])
 @jwt_required()
 def submit_quiz_attempt(quiz_id):
     """Submit a quiz attempt"""
-    logger.info(f"Quiz attempt submission for quiz {quiz_id}")
+    logger.debug("Quiz attempt submission for quiz %s", quiz_id)
     
     try:
         user_id = get_jwt_identity()
         user_id_str = str(user_id)
         user_filter = get_user_filter(user_id)
         
-        data = request.get_json()
+        # Reject oversized submissions from Content-Length before parsing anything; chunked bodies
+        # without one are cut off by the bounded read instead
+        if request.content_length is not None and request.content_length > Config.MAX_ATTEMPT_BYTES:
+            return jsonify({"error": "Quiz attempt is too large"}), 413
+        try:
+            data = parse_json_body(Config.MAX_ATTEMPT_BYTES)
+        except RequestEntityTooLarge:
+            return jsonify({"error": "Quiz attempt is too large"}), 413
         
         # Check if data contains answers
         if not data or 'answers' not in data:
             return jsonify({"error": "Quiz answers are required"}), 400
         
         answers = data['answers']
+        if not isinstance(answers, dict):
+            return jsonify({"error": "Answers must be an object keyed by question index"}), 400
         
         # Validate quiz ID
-        if not ObjectId.is_valid(quiz_id):
+        quiz_oid = parse_object_id(quiz_id)
+        if quiz_oid is None:
             return jsonify({"error": "Invalid quiz ID"}), 400
             
-        # Get the quiz
+        # Get only what grading and the attempt record need; question text and options stay behind
         quiz = db.quizzes.find_one({
-            "_id": ObjectId(quiz_id),
-            "$or": user_filter["$or"]
-        })
+            "_id": quiz_oid,
+            **user_filter
+        }, GRADING_PROJECTION)
         
         if not quiz:
             return jsonify({"error": "Quiz not found"}), 404
         
         # Grade the quiz
-        score = 0
-        results = []
-        
-        for i, question in enumerate(quiz['questions']):
-            question_id = str(i)  # Use index as question ID
-            user_answer = answers.get(question_id)
-            
-            # If question wasn't answered
-            if user_answer is None:
-                results.append({
-                    "question_id": i,
-                    "correct": False,
-                    "correct_answer": question['correct_answer'],
-                    "explanation": question.get('explanation', '')
-                })
-                continue
-            
-            # Check if answer is correct
-            is_correct = False
-            
-            if question['type'] == 'multiple_choice':
-                is_correct = user_answer == question['correct_answer']
-            elif question['type'] == 'true_false':
-                # Handle boolean conversion properly
-                if isinstance(user_answer, str):
-                    user_answer_bool = user_answer.lower() == 'true'
-                else:
-                    user_answer_bool = bool(user_answer)
-                
-                correct_answer_bool = question['correct_answer']
-                if isinstance(correct_answer_bool, str):
-                    correct_answer_bool = correct_answer_bool.lower() == 'true'
-                    
-                is_correct = user_answer_bool == correct_answer_bool
-            elif question['type'] == 'short_answer':
-                # Simple exact match for short answers (case-insensitive)
-                if isinstance(user_answer, str) and isinstance(question['correct_answer'], str):
-                    is_correct = user_answer.lower().strip() == question['correct_answer'].lower().strip()
-                else:
-                    is_correct = user_answer == question['correct_answer']
-            
-            if is_correct:
-                score += 1
-            
-            results.append({
-                "question_id": i,
-                "correct": is_correct,
-                "correct_answer": question['correct_answer'],
-                "explanation": question.get('explanation', '')
-            })
+        score, results = grade_answers(quiz['questions'], answers, quiz.get('answer_key'))
         
         # Calculate percentage
         total_questions = len(quiz['questions'])
@@ -332,7 +746,7 @@ def submit_quiz_attempt(quiz_id):
         
         # Save attempt to database with string user_id
         attempt = {
-            "quiz_id": str(quiz_id),  # Store as string
+            "quiz_id": quiz_oid,  # Stored as an ObjectId, like the quiz's _id
             "user_id": user_id_str,  # Store as string
             "quiz_title": quiz.get('title', 'Untitled Quiz'),
             "answers": answers,
@@ -340,11 +754,17 @@ def submit_quiz_attempt(quiz_id):
             "total_questions": total_questions,
             "percentage": percentage,
             "results": results,
-            "created_at": datetime.now()
+            "created_at": datetime.now(timezone.utc)
         }
         
-        attempt_id = db.quiz_attempts.insert_one(attempt).inserted_id
-        logger.info(f"Quiz attempt {attempt_id} submitted for user {user_id_str}")
+        def record_attempt(session):
+            attempt_id = db.quiz_attempts.insert_one(attempt, session=session).inserted_id
+            # Keep the quiz's attempt counter in step so listings don't have to count attempts
+            db.quizzes.update_one({"_id": quiz_oid}, {"$inc": {"attempt_count": 1}}, session=session)
+            return attempt_id
+        
+        attempt_id = run_in_transaction(record_attempt)
+        logger.info("Quiz attempt %s submitted for user %s", attempt_id, user_id_str)
         
         return jsonify({
             "message": "Quiz attempt submitted successfully",
@@ -356,14 +776,13 @@ def submit_quiz_attempt(quiz_id):
         }), 201
         
     except Exception as e:
-        logger.error(f"Error in submit_quiz_attempt: {str(e)}")
+        logger.exception("Error in submit_quiz_attempt")
         return jsonify({"error": f"Failed to submit quiz: {str(e)}"}), 500
 
 @quiz_bp.route('/attempts', methods=['OPTIONS'])
 def quiz_attempts_options():
     """Handle OPTIONS request for quiz attempts endpoint"""
-    response = jsonify({'status': 'ok'})
-    return response
+    return preflight_response()
 
 @quiz_bp.route('/attempts', methods=['GET'])
 @jwt_required()
@@ -373,9 +792,7 @@ def get_user_attempts():
     user_filter = get_user_filter(user_id)
     
     # Pagination parameters
-    page = int(request.args.get('page', 1))
-    limit = int(request.args.get('limit', 10))
-    skip = (page - 1) * limit
+    page, limit, skip = page_params()
     
     # Filtering parameters
     search_query = request.args.get('search', '')
@@ -390,11 +807,14 @@ def get_user_attempts():
     
     # Add search filter if provided
     if search_query:
-        query_filter["quiz_title"] = {"$regex": search_query, "$options": "i"}
+        query_filter["$text"] = {"$search": search_query}
     
     # Add quiz filter if provided
     if quiz_id:
-        query_filter["quiz_id"] = quiz_id
+        quiz_oid = parse_object_id(quiz_id)
+        if quiz_oid is None:
+            return jsonify({"error": "Invalid quiz ID"}), 400
+        query_filter["quiz_id"] = quiz_oid
     
     # Add date range filter if provided
     date_filter = {}
@@ -415,99 +835,102 @@ def get_user_attempts():
     if date_filter:
         query_filter["created_at"] = date_filter
     
-    # Count total for pagination
-    total_attempts = db.quiz_attempts.count_documents(query_filter)
-    
-    # Get attempts with pagination
-    attempts = list(db.quiz_attempts.find(query_filter).sort("created_at", -1).skip(skip).limit(limit))
+    # Get the total and the page of attempts, best text matches first when searching
+    # Detailed results and answers are left out of the listing
+    sort = BEST_MATCH_FIRST if search_query else NEWEST_FIRST
+    after = None if search_query else parse_page_cursor()
+    total_attempts, attempts, has_next = fetch_page(db.quiz_attempts, query_filter, sort, skip, limit,
+                                                    ATTEMPT_LIST_PROJECTION, after, wants_total())
     
-    # Convert ObjectId to string for JSON serialization
-    for attempt in attempts:
-        attempt['_id'] = str(attempt['_id'])
-        
-        # Format dates
-        if 'created_at' in attempt:
-            attempt['created_at'] = attempt['created_at'].isoformat()
-        
-        # Simplify response by removing detailed results
-        if 'results' in attempt:
-            del attempt['results']
-        
-        if 'answers' in attempt:
-            del attempt['answers']
-    
-    return jsonify({
-        "attempts": attempts,
-        "pagination": {
-            "total": total_attempts,
-            "page": page,
-            "limit": limit,
-            "pages": (total_attempts + limit - 1) // limit
-        }
-    }), 200
+    return page_response("attempts", attempts, total_attempts, page, limit, has_next,
+                       None if search_query else next_page_cursor(attempts, has_next))
+
+def summarize_collection(collection, match, recent_limit, recent_project, average_field=None):
+    """Count, newest documents and optional average for one collection in a single $facet query"""
+    facets = {
+        "count": [{"$count": "n"}],
+        "recent": [
+            {"$sort": {"created_at": -1}},
+            {"$limit": recent_limit},
+            {"$project": recent_project}
+        ]
+    }
+    if average_field:
+        facets["stats"] = [{"$group": {"_id": None, "avg": {"$avg": f"${average_field}"}}}]
+    
+    result = next(collection.aggregate([{"$match": match}, {"$facet": facets}]))
+    count = result["count"][0]["n"] if result["count"] else 0
+    average = result["stats"][0]["avg"] if result.get("stats") else None
+    return count, result["recent"], average
 
 @quiz_bp.route('/dashboard', methods=['GET'])
 @jwt_required()
 def get_quiz_dashboard():
     """Get quiz dashboard data for the current user"""
     user_id = get_jwt_identity()
+    user_oid = user_object_id(user_id)
     user_filter = get_user_filter(user_id)
     
-    logger.info(f"Getting dashboard for user {user_id}")
+    logger.debug("Getting dashboard for user %s", user_id)
     
     try:
-        # Get total counts for stats
-        total_materials = db.study_materials.count_documents(user_filter)
-        total_quizzes = db.quizzes.count_documents(user_filter)
-        total_attempts = db.quiz_attempts.count_documents(user_filter)
+        # One round trip per collection: total, newest documents and (for attempts) the average score
+        total_materials, recent_materials, _ = summarize_collection(
+            db.study_materials, {"user_id": user_oid}, 3,
+            {"title": 1, "description": 1, "created_at": 1}
+        )
+        # Quizzes are deleted along with their material, so a user without materials has none
+        total_quizzes, recent_quizzes = 0, []
+        if total_materials:
+            total_quizzes, recent_quizzes, _ = summarize_collection(
+                db.quizzes, user_filter, 3,
+                {"title": 1, "description": 1, "created_at": 1,
+                 "num_questions": 1}
+            )
+        total_attempts, attempts, avg_result = summarize_collection(
+            db.quiz_attempts, user_filter, 5,
+            {"quiz_id": 1, "quiz_title": 1, "score": 1, "total_questions": 1, "percentage": 1, "created_at": 1},
+            average_field="percentage"
+        )
         
-        logger.info(f"Dashboard stats - Materials: {total_materials}, Quizzes: {total_quizzes}, Attempts: {total_attempts}")
+        logger.debug("Dashboard stats - Materials: %d, Quizzes: %d, Attempts: %d",
+                     total_materials, total_quizzes, total_attempts)
         
         # Calculate average score
-        avg_score = 0
-        if total_attempts > 0:
-            avg_pipeline = [
-                {"$match": user_filter},
-                {"$group": {"_id": None, "avgScore": {"$avg": "$percentage"}}}
-            ]
-            avg_result = list(db.quiz_attempts.aggregate(avg_pipeline))
-            avg_score = round(avg_result[0]['avgScore'], 2) if avg_result and avg_result[0].get('avgScore') else 0
+        avg_score = round(avg_result, 2) if avg_result else 0
         
         # Get recent materials
         formatted_materials = []
-        recent_materials = list(db.study_materials.find(user_filter).sort("created_at", -1).limit(3))
         for material in recent_materials:
             formatted_materials.append({
                 "id": str(material['_id']),
                 "title": material.get('title', 'Untitled'),
                 "description": material.get('description', ''),
-                "created_at": material.get('created_at', datetime.now()).isoformat()
+                "created_at": material.get('created_at', _EPOCH)
             })
         
         # Get recent quizzes
         formatted_quizzes = []
-        recent_quizzes = list(db.quizzes.find(user_filter).sort("created_at", -1).limit(3))
         for quiz in recent_quizzes:
             formatted_quizzes.append({
                 "id": str(quiz['_id']),
                 "title": quiz.get('title', 'Untitled Quiz'),
                 "description": quiz.get('description', ''),
-                "num_questions": len(quiz.get('questions', [])),
-                "created_at": quiz.get('created_at', datetime.now()).isoformat()
+                "num_questions": quiz.get('num_questions', 0),
+                "created_at": quiz.get('created_at', _EPOCH)
             })
         
         # Get recent attempts
         formatted_attempts = []
-        attempts = list(db.quiz_attempts.find(user_filter).sort("created_at", -1).limit(5))
         for attempt in attempts:
             formatted_attempts.append({
                 "_id": str(attempt['_id']),
-                "quiz_id": attempt.get('quiz_id', ''),
+                "quiz_id": str(attempt.get('quiz_id', '')),
                 "quiz_title": attempt.get('quiz_title', 'Unknown Quiz'),
                 "score": attempt.get('score', 0),
                 "total_questions": attempt.get('total_questions', 0),
                 "percentage": attempt.get('percentage', 0),
-                "created_at": attempt.get('created_at', datetime.now()).isoformat()
+                "created_at": attempt.get('created_at', _EPOCH)
             })
         
         response = {
@@ -522,12 +945,15 @@ def get_quiz_dashboard():
             }
         }
         
-        return jsonify(response), 200
+        # Body-hash ETag: an unchanged dashboard goes back as an empty 304
+        response = jsonify(response)
+        response.add_etag()
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     
     except Exception as e:
-        logger.error(f"Error in get_quiz_dashboard: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_quiz_dashboard")
         return jsonify({"error": f"Failed to retrieve dashboard data: {str(e)}"}), 500
 
 @quiz_bp.route('/attempts/<quiz_id>', methods=['GET'])
@@ -538,37 +964,22 @@ def get_quiz_attempts(quiz_id):
     user_filter = get_user_filter(user_id)
     
     # Pagination parameters
-    page = int(request.args.get('page', 1))
-    limit = int(request.args.get('limit', 10))
-    skip = (page - 1) * limit
+    page, limit, skip = page_params()
+    
+    quiz_oid = parse_object_id(quiz_id)
+    if quiz_oid is None:
+        return jsonify({"error": "Invalid quiz ID"}), 400
     
     # Create filter combining user filter and quiz_id
     query_filter = user_filter.copy()
-    query_filter["quiz_id"] = quiz_id
+    query_filter["quiz_id"] = quiz_oid
     
-    # Count total for pagination
-    total_attempts = db.quiz_attempts.count_documents(query_filter)
+    # Get the total and the page of attempts
+    total_attempts, attempts, has_next = fetch_page(db.quiz_attempts, query_filter, NEWEST_FIRST, skip, limit,
+                                                    after=parse_page_cursor(), count=wants_total())
     
-    # Get attempts with pagination
-    attempts = list(db.quiz_attempts.find(query_filter).sort("created_at", -1).skip(skip).limit(limit))
-    
-    # Convert ObjectId to string for JSON serialization
-    for attempt in attempts:
-        attempt['_id'] = str(attempt['_id'])
-        
-        # Format date
-        if 'created_at' in attempt:
-            attempt['created_at'] = attempt['created_at'].isoformat()
-    
-    return jsonify({
-        "attempts": attempts,
-        "pagination": {
-            "total": total_attempts,
-            "page": page,
-            "limit": limit,
-            "pages": (total_attempts + limit - 1) // limit
-        }
-    }), 200
+    return page_response("attempts", attempts, total_attempts, page, limit, has_next,
+                       next_page_cursor(attempts, has_next))
 
 @quiz_bp.route('/<quiz_id>', methods=['DELETE'])
 @jwt_required()
@@ -577,20 +988,24 @@ def delete_quiz(quiz_id):
     user_id = get_jwt_identity()
     user_filter = get_user_filter(user_id)
     
-    if not ObjectId.is_valid(quiz_id):
+    quiz_oid = parse_object_id(quiz_id)
+    if quiz_oid is None:
         return jsonify({"error": "Invalid quiz ID"}), 400
     
-    quiz_filter = {"_id": ObjectId(quiz_id)}
+    quiz_filter = {"_id": quiz_oid}
     quiz_filter.update(user_filter)
     
-    result = db.quizzes.delete_one(quiz_filter)
+    def delete_with_attempts(session):
+        deleted = db.quizzes.delete_one(quiz_filter, session=session).deleted_count
+        if deleted:
+            # Also delete the user's attempts at this quiz, via the (quiz_id, user_id) index
+            db.quiz_attempts.delete_many({"quiz_id": quiz_oid, **user_filter}, session=session)
+        return deleted
     
-    if result.deleted_count == 0:
+    # Delete the quiz and its attempts atomically
+    if not run_in_transaction(delete_with_attempts):
         return jsonify({"error": "Quiz not found or not owned by user"}), 404
     
-    # Also delete any quiz attempts
-    db.quiz_attempts.delete_many({"quiz_id": str(quiz_id)})
-    
-    logger.info(f"Deleted quiz {quiz_id} and its attempts")
+    logger.info("Deleted quiz %s and its attempts", quiz_id)
     
     return jsonify({"message": "Quiz deleted successfully"}), 200
\ No newline at end of file
@@ -0,0 +1,111 @@
+# backend/db.py
+import logging
+import threading
+import time
+from functools import lru_cache
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Shared MongoDB client - a single, explicitly sized connection pool for the whole process.
+# minPoolSize keeps warm sockets open; the startup server_info() call in app.py triggers the fill.
+# Wire compression is negotiated with the server; zlib is the fallback when zstd isn't available.
+client = MongoClient(Config.MONGO_URI,
+                     maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+                     minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+                     maxIdleTimeMS=Config.MONGO_MAX_IDLE_TIME_MS,
+                     waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                     socketTimeoutMS=Config.MONGO_SOCKET_TIMEOUT_MS,
+                     connectTimeoutMS=Config.MONGO_CONNECT_TIMEOUT_MS,
+                     serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                     retryWrites=True,
+                     retryReads=True,
+                     compressors=Config.MONGO_COMPRESSORS,
+                     uuidRepresentation='standard')
+db = client.quiz_planner
+
+
+@lru_cache(maxsize=None)
+def maintenance_db():
+    """Database handle for migrations and index builds. Its small client has no socket timeout,
+    since collection-wide updates and index builds can run far longer than a request may."""
+    maintenance_client = MongoClient(Config.MONGO_URI,
+                                     maxPoolSize=2,
+                                     connectTimeoutMS=Config.MONGO_CONNECT_TIMEOUT_MS,
+                                     serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                                     socketTimeoutMS=None,
+                                     retryWrites=True,
+                                     retryReads=True,
+                                     compressors=Config.MONGO_COMPRESSORS,
+                                     uuidRepresentation='standard')
+    return maintenance_client.quiz_planner
+
+# Optional Redis client for response caching; None when REDIS_URL isn't configured
+redis_client = None
+if Config.REDIS_URL:
+    import redis
+    redis_client = redis.Redis.from_url(Config.REDIS_URL,
+                                        socket_timeout=0.5,
+                                        socket_connect_timeout=0.5,
+                                        health_check_interval=30)
+
+
+# Backoff between index build attempts, capped so a persistent failure keeps being logged
+INDEX_RETRY_MAX_DELAY = 60
+
+def build_indexes_in_background(name, create_indexes):
+    """Run idempotent create_indexes(database) on a daemon thread so worker startup doesn't wait on MongoDB.
+    It gets the maintenance database, so a long build isn't cut off by the request socket timeout.
+    Failures are retried with backoff until the build succeeds."""
+    def run():
+        delay = 1
+        while True:
+            try:
+                create_indexes(maintenance_db())
+                return
+            except PyMongoError as e:
+                logger.error("Failed to create %s indexes, retrying in %ds: %s", name, delay, e)
+            time.sleep(delay)
+            delay = min(delay * 2, INDEX_RETRY_MAX_DELAY)
+    
+    threading.Thread(target=run, name=f"{name}-indexes", daemon=True).start()
+
+
+def run_in_transaction(callback):
+    """Run callback(session) in a transaction, or with session=None on a standalone server"""
+    try:
+        with client.start_session() as session:
+            return session.with_transaction(callback)
+    except OperationFailure as e:
+        # IllegalOperation: transactions need a replica set or mongos
+        if e.code == 20:
+            return callback(None)
+        raise
+
+
+class InvalidUserId(Exception):
+    """Raised when a token identity is not a valid user id"""
+
+
+@lru_cache(maxsize=4096)
+def parse_object_id(value):
+    """Convert a hex string to an ObjectId, or None if it is not a valid id"""
+    if not isinstance(value, str):
+        return None
+    # Parse once; is_valid() followed by ObjectId() would parse the hex twice
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def user_object_id(user_id):
+    """Resolve a JWT identity to an ObjectId, raising InvalidUserId for malformed ids"""
+    oid = parse_object_id(user_id)
+    if oid is None:
+        raise InvalidUserId(user_id)
+    return oid
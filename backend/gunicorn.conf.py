@@ -0,0 +1,14 @@
+# backend/gunicorn.conf.py
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# gevent workers patch sockets at boot, so requests waiting on Gemini or
+# MongoDB yield to other connections instead of holding a whole worker
+worker_class = "gevent"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+
+# Quiz generation can wait several seconds on Gemini
+timeout = 120
@@ -0,0 +1,39 @@
+# backend/http_helpers.py
+import orjson
+from flask import Response, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+def parse_json_body(max_bytes=None):
+    """Parse a JSON object body with orjson, or return None for non-JSON or malformed bodies.
+    With max_bytes, a longer body raises RequestEntityTooLarge (413) whether or not it sent a Content-Length."""
+    if not request.is_json:
+        return None
+    if max_bytes is None:
+        # cache=False so the raw body isn't kept on the request alongside the parsed dict
+        body = request.get_data(cache=False)
+    else:
+        # One byte past the limit is enough to tell; a chunked body is never read further than that
+        body = request.stream.read(max_bytes + 1)
+        if len(body) > max_bytes:
+            raise RequestEntityTooLarge()
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def not_modified(etag):
+    """Return an empty 304 if the client already holds this version, else None"""
+    if request.if_none_match.contains(etag):
+        return with_etag(Response(status=304), etag)
+    return None
+
+
+def with_etag(response, etag):
+    """Tag a response for conditional GETs; clients revalidate on every use"""
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,29 @@
+# backend/json_encoding.py
+import orjson
+from bson.objectid import ObjectId
+from flask.json import JSONEncoder, JSONDecoder
+
+
+class OrjsonEncoder(JSONEncoder):
+    """Flask JSON encoder that serializes with orjson instead of the stdlib encoder loop"""
+
+    def encode(self, o):
+        option = orjson.OPT_NAIVE_UTC
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(o, default=self.default, option=option).decode()
+
+    def default(self, o):
+        # orjson handles datetimes, UUIDs and dataclasses natively; ObjectIds render as strings
+        if isinstance(o, ObjectId):
+            return str(o)
+        return super().default(o)
+
+
+class OrjsonDecoder(JSONDecoder):
+    """Flask JSON decoder that parses with orjson"""
+
+    def decode(self, s):
+        return orjson.loads(s)
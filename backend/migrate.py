@@ -0,0 +1,113 @@
+# backend/migrate.py
+"""One-off data migrations. Each one is idempotent, so running this again is safe.
+
+Usage: python migrate.py
+"""
+import logging
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from db import maintenance_db
+
+logger = logging.getLogger(__name__)
+
+# Migrations run on the maintenance client: collection-wide updates outlast the request socket timeout
+db = maintenance_db()
+
+# Writes sent per bulk_write call
+BULK_BATCH_SIZE = 1000
+
+
+def material_user_ids_to_object_id():
+    """Store study_materials.user_id as an ObjectId everywhere - 12-byte index keys, no $or"""
+    result = db.study_materials.update_many(
+        {"user_id": {"$type": "string"}},
+        [{"$set": {"user_id": {"$toObjectId": "$user_id"}}}]
+    )
+    return result.modified_count
+
+
+def quiz_user_ids_to_string():
+    """Store quizzes and quiz_attempts user_id as a string everywhere so lookups need no $or"""
+    modified = 0
+    for collection in (db.quizzes, db.quiz_attempts):
+        modified += collection.update_many(
+            {"user_id": {"$type": "objectId"}},
+            [{"$set": {"user_id": {"$toString": "$user_id"}}}]
+        ).modified_count
+    return modified
+
+
+def attempt_quiz_ids_to_object_id():
+    """Store quiz_attempts.quiz_id as an ObjectId, matching the quiz _id it refers to"""
+    return db.quiz_attempts.update_many(
+        {"quiz_id": {"$type": "string"}},
+        [{"$set": {"quiz_id": {"$toObjectId": "$quiz_id"}}}]
+    ).modified_count
+
+
+def quiz_question_counts():
+    """Store num_questions on quizzes saved before it was written at generation time"""
+    return db.quizzes.update_many(
+        {"num_questions": {"$exists": False}},
+        [{"$set": {"num_questions": {"$size": {"$ifNull": ["$questions", []]}}}}]
+    ).modified_count
+
+
+def quiz_attempt_counts():
+    """Recount quizzes.attempt_count from the stored attempts, writing only the counts that changed"""
+    counts = {
+        row["_id"]: row["n"]
+        for row in db.quiz_attempts.aggregate([{"$group": {"_id": "$quiz_id", "n": {"$sum": 1}}}])
+    }
+    modified = 0
+    updates = []
+    # Walk the quizzes rather than filtering on a $nin of every counted id, which can outgrow 16MB
+    for quiz in db.quizzes.find({}, {"attempt_count": 1}):
+        n = counts.get(quiz["_id"], 0)
+        if quiz.get("attempt_count") != n:
+            updates.append(UpdateOne({"_id": quiz["_id"]}, {"$set": {"attempt_count": n}}))
+        if len(updates) == BULK_BATCH_SIZE:
+            modified += db.quizzes.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        modified += db.quizzes.bulk_write(updates, ordered=False).modified_count
+    return modified
+
+
+def drop_superseded_listing_indexes():
+    """Drop the listing indexes that now end in _id; the longer keys cover everything they served"""
+    superseded = {
+        db.quizzes: ["user_id_1_created_at_-1", "user_id_1_material_id_1_created_at_-1"],
+        db.quiz_attempts: ["user_id_1_created_at_-1", "quiz_id_1_user_id_1_created_at_-1"],
+    }
+    dropped = 0
+    for collection, names in superseded.items():
+        for name in names:
+            try:
+                collection.drop_index(name)
+                dropped += 1
+            except OperationFailure:
+                pass  # Already dropped
+    return dropped
+
+
+MIGRATIONS = [
+    material_user_ids_to_object_id,
+    quiz_user_ids_to_string,
+    attempt_quiz_ids_to_object_id,
+    quiz_question_counts,
+    quiz_attempt_counts,
+    drop_superseded_listing_indexes,
+]
+
+
+def run_all():
+    """Apply every migration in order"""
+    for migration in MIGRATIONS:
+        modified = migration()
+        logger.info("%s: %d documents updated", migration.__name__, modified)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_all()
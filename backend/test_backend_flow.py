@@ -28,6 +28,9 @@ SAMPLE_MATERIAL = {
     "tags": ["python", "programming"]
 }
 
+# One pooled session so every call reuses a keep-alive connection instead of a new handshake
+SESSION = requests.Session()
+
 def print_response(response, description):
     print(f"\n{description}")
     print(f"Status: {response.status_code}")
@@ -36,9 +39,6 @@ def print_response(response, description):
     except:
         print(response.text)
 
-def get_auth_header(token):
-    return {"Authorization": f"Bearer {token}"}
-
 def display_quiz_questions(quiz_data):
     """Display quiz questions in a readable format"""
     print("\n" + "="*50)
@@ -75,19 +75,19 @@ def test_auth_flow():
     print("=== TESTING AUTH FLOW ===")
     
     # Cleanup existing test user
-    requests.post(f"{BASE_URL}/auth/login", json={
+    SESSION.post(f"{BASE_URL}/auth/login", json={
         "email": TEST_USER["email"],
         "password": TEST_USER["password"]
     })
     
     # Register
     print("\n1. Registering test user")
-    reg_resp = requests.post(f"{BASE_URL}/auth/register", json=TEST_USER)
+    reg_resp = SESSION.post(f"{BASE_URL}/auth/register", json=TEST_USER)
     print_response(reg_resp, "Registration Response")
     
     # Login
     print("\n2. Logging in test user")
-    login_resp = requests.post(f"{BASE_URL}/auth/login", json={
+    login_resp = SESSION.post(f"{BASE_URL}/auth/login", json={
         "email": TEST_USER["email"],
         "password": TEST_USER["password"]
     })
@@ -98,22 +98,23 @@ def test_auth_flow():
         return None
     
     token = login_resp.json()["access_token"]
+    # Authenticate every later request on the session
+    SESSION.headers["Authorization"] = f"Bearer {token}"
     
     # Get user info
     print("\n3. Getting current user info")
-    me_resp = requests.get(f"{BASE_URL}/auth/me", headers=get_auth_header(token))
+    me_resp = SESSION.get(f"{BASE_URL}/auth/me")
     print_response(me_resp, "Current User Response")
     
     return token
 
-def test_material_flow(token):
+def test_material_flow():
     print("\n=== TESTING MATERIAL FLOW ===")
     
     # Create material
     print("\n1. Creating study material")
-    create_resp = requests.post(
+    create_resp = SESSION.post(
         f"{BASE_URL}/materials",
-        headers=get_auth_header(token),
         json=SAMPLE_MATERIAL
     )
     print_response(create_resp, "Create Material Response")
@@ -126,30 +127,23 @@ def test_material_flow(token):
     
     # Get all materials
     print("\n2. Getting all materials")
-    get_all_resp = requests.get(
-        f"{BASE_URL}/materials",
-        headers=get_auth_header(token)
-    )
+    get_all_resp = SESSION.get(f"{BASE_URL}/materials")
     print_response(get_all_resp, "All Materials Response")
     
     # Get single material
     print("\n3. Getting single material")
-    get_one_resp = requests.get(
-        f"{BASE_URL}/materials/{material_id}",
-        headers=get_auth_header(token)
-    )
+    get_one_resp = SESSION.get(f"{BASE_URL}/materials/{material_id}")
     print_response(get_one_resp, "Single Material Response")
     
     return material_id
 
-def test_quiz_flow(token, material_id):
+def test_quiz_flow(material_id):
     print("\n=== TESTING QUIZ FLOW ===")
     
     # Generate quiz
     print("\n1. Generating quiz from material")
-    quiz_resp = requests.post(
+    quiz_resp = SESSION.post(
         f"{BASE_URL}/quizzes/generate",
-        headers=get_auth_header(token),
         json={
             "material_id": material_id,
             "num_questions": 3,
@@ -166,9 +160,8 @@ def test_quiz_flow(token, material_id):
     
     # Get quiz details
     print("\n2. Fetching quiz details")
-    quiz_details_resp = requests.get(
-        f"{BASE_URL}/quizzes/{quiz_id}",
-        headers=get_auth_header(token)
+    quiz_details_resp = SESSION.get(
+        f"{BASE_URL}/quizzes/{quiz_id}"
     )
     print_response(quiz_details_resp, "Quiz Details Response")
     
@@ -186,12 +179,12 @@ def main():
         return
     
     # Test materials
-    material_id = test_material_flow(token)
+    material_id = test_material_flow()
     if not material_id:
         return
     
     # Test quiz generation
-    quiz_id = test_quiz_flow(token, material_id)
+    quiz_id = test_quiz_flow(material_id)
     
     print("\n=== TESTING COMPLETE ===")
     if quiz_id: